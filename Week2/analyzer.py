@@ -0,0 +1,1287 @@
+"""
+Phân tích văn bản tiếng Việt và tiếng Anh (NLTK, spaCy, pyvi, underthesea)
+Module này không phụ thuộc Flask, dùng chung cho web app và công cụ dòng lệnh
+"""
+
+import re
+import logging
+import threading
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, List, Optional, Tuple
+
+import config
+from cache import AnalysisCache, SQLiteCache, TieredCache, make_cache_key
+from deadline import Deadline
+from language import TextProfile, detection_sample, profile_text, split_language_runs
+from layers import LAYERS, analyzes, merge_layers, select_layers, wants, with_layers
+from metrics import ANALYSES, STAGE_SECONDS, timed
+from profiling import trace_methods
+from rules import RuleBook
+from spans import align_tokens, has_span, merge_entities
+
+logger = logging.getLogger(__name__)
+
+# NLTK, spaCy, langdetect, pyvi và underthesea được import ở lần dùng đầu tiên (hoặc khi warm-up)
+# để import module này (và app.py) không phải chờ nạp models
+ENGINES = ('langdetect', 'pyvi', 'underthesea', 'spacy', 'nltk')
+# Engines bắt buộc phải sẵn sàng; thiếu spaCy/NLTK thì ứng dụng vẫn chạy nhưng bị giới hạn như trước
+REQUIRED_ENGINES = ('langdetect', 'pyvi', 'underthesea')
+
+# Văn bản mẫu cho warm-up, chạy qua từng nhánh ngôn ngữ
+WARMUP_SAMPLES = {
+    'vietnamese': 'Hà Nội là thủ đô của Việt Nam. Ông Nguyễn Văn An sinh năm 1980.',
+    'english': 'Apple Inc. is located in Cupertino, California. Tim Cook is the CEO of the company.',
+    'mixed': 'Công ty Apple có trụ sở tại California, the company was founded by Steve Jobs.'
+}
+
+def package_version(name: str) -> str:
+    """Version của package đã cài đặt mà không cần import, chuỗi rỗng nếu chưa cài"""
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return ''
+
+def ensure_nltk_data():
+    """Tải dữ liệu NLTK cần thiết nếu chưa có"""
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt')
+    
+    try:
+        nltk.data.find('taggers/averaged_perceptron_tagger')
+    except LookupError:
+        nltk.download('averaged_perceptron_tagger')
+
+# Các thành phần spaCy bị loại bỏ theo từng profile: kết quả chỉ dùng token, POS, tag, lemma và entities
+SPACY_PROFILES = {
+    'full': [],
+    'fast': ['parser', 'senter']
+}
+
+# Các thành phần spaCy chỉ phục vụ từng layer, được tắt khi layer đó không được yêu cầu
+SPACY_LAYER_COMPONENTS = {
+    'pos': ('tagger', 'morphologizer', 'attribute_ruler', 'lemmatizer', 'parser', 'senter'),
+    'entities': ('ner', 'entity_ruler')
+}
+
+def load_spacy_model(name: str = "en_core_web_sm", profile: str = 'full'):
+    """Khởi tạo spaCy model theo profile, trả về None nếu model chưa được cài đặt"""
+    if profile not in SPACY_PROFILES:
+        raise ValueError(f"Profile spaCy không hợp lệ: {profile} (chọn một trong {', '.join(SPACY_PROFILES)})")
+    import spacy
+    try:
+        return spacy.load(name, exclude=SPACY_PROFILES[profile])
+    except OSError:
+        print(f"SpaCy model '{name}' chưa được cài đặt.")
+        print(f"Vui lòng chạy: python -m spacy download {name}")
+        return None
+
+@lru_cache(maxsize=None)
+def load_nltk():
+    """Import NLTK và kiểm tra dữ liệu ở lần dùng đầu tiên, trả về (word_tokenize, pos_tag)"""
+    ensure_nltk_data()
+    from nltk.tokenize import word_tokenize
+    from nltk.tag import pos_tag
+    return word_tokenize, pos_tag
+
+@lru_cache(maxsize=None)
+def load_langdetect():
+    """Import langdetect, trả về hàm detect"""
+    from langdetect import detect, DetectorFactory
+    # Thiết lập seed cho langdetect để có kết quả ổn định
+    DetectorFactory.seed = 0
+    return detect
+
+@lru_cache(maxsize=None)
+def load_pyvi():
+    """Import pyvi, trả về (ViTokenizer, ViPosTagger)"""
+    from pyvi import ViTokenizer, ViPosTagger
+    return ViTokenizer, ViPosTagger
+
+@lru_cache(maxsize=None)
+def load_underthesea():
+    """Import underthesea"""
+    import underthesea
+    return underthesea
+
+@lru_cache(maxsize=config.LANGUAGE_CACHE_SIZE)
+def _detect_language_sample(sample_text: str) -> str:
+    """Phát hiện ngôn ngữ cho đoạn mẫu, cache theo nội dung đoạn mẫu"""
+    try:
+        return load_langdetect()(sample_text)
+    except:
+        return 'unknown'
+
+# Regex số dùng chung cho add_missing_vietnamese_entities: một số (có thể là tỷ số "2-1")
+# kèm đơn vị phía sau nếu có (tuổi, giường bệnh, triệu/nghìn/tỷ, g/m)
+NUMBER_LEXER = re.compile(
+    r'(?<!\w)(?P<number>\d+(?:[.,]\d+)?)'
+    r'(?:\s*-\s*(?P<number2>\d+))?'
+    r'(?:\s*(?P<unit>tuổi|giường\s*bệnh|triệu|nghìn|tỷ|[gm](?!\w)))?'
+)
+YEAR_PATTERN = re.compile(r'(?:19|20)\d{2}')
+FULL_NAME_PATTERN = re.compile(
+    r'(nguyễn|trần|lê|phạm|hoàng|phan|vũ|võ|đặng|bùi|đỗ|hồ|ngô|dương|lý)\s+'
+    r'(văn|thị|đức|minh|hùng|dũng|tuấn|nam|linh|hoa|mai|lan|thảo|ngọc|vy|anh|huy|đức|quang|phong|long|khánh)'
+)
+FOREIGN_NAME_PATTERN = re.compile(
+    r'(park|kim|lee|choi|jung|yoon|kang|lim|oh|seo)\s+'
+    r'(hang-seo|min-jae|son|heung-min|jae-sung|woo-young|hyun-jin|dong-gook|bo-kyung|young-pyo)'
+)
+
+def _allow(deadline: Optional[Deadline], stage: str) -> bool:
+    """Còn thời gian cho bước `stage` (luôn True nếu request không có deadline)"""
+    return deadline is None or deadline.allow(stage)
+
+def lower_preserving_offsets(text: str) -> str:
+    """Chuyển thành chữ thường mà vẫn giữ nguyên độ dài (offset) của văn bản gốc"""
+    text_lower = text.lower()
+    if len(text_lower) == len(text):
+        return text_lower
+    # Một số ký tự đổi độ dài khi lower() (ví dụ 'İ'), giữ nguyên các ký tự đó
+    return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+class VietnameseDocument:
+    """Văn bản tiếng Việt đã tách từ, dùng chung cho các bước token, POS và NER"""
+    
+    def __init__(self, text: str, tokens: List[str], pos_tags: List[Tuple[str, str]]):
+        self.text = text
+        self.tokens = tokens
+        self.pos_tags = pos_tags
+        self._ner_results = None
+    
+    @property
+    def ner_results(self) -> List[Tuple]:
+        """Kết quả underthesea.ner, chỉ chạy một lần cho mỗi văn bản"""
+        if self._ner_results is None:
+            with STAGE_SECONDS.time(stage='underthesea_ner'):
+                self._ner_results = load_underthesea().ner(self.text)
+        return self._ner_results
+
+@trace_methods
+class TextAnalyzer:
+    """Lớp phân tích văn bản sử dụng NLTK, spaCy và thư viện tiếng Việt"""
+    
+    def __init__(self, nlp=None):
+        # Models không được nạp ở đây: nạp khi dùng lần đầu hoặc bởi warm_up()
+        self._nlp = nlp
+        self._nlp_loaded = nlp is not None
+        self._nlp_lock = threading.Lock()
+        self.engines: Dict[str, Dict] = {name: {'status': 'cold'} for name in ENGINES}
+        self.warmup_state = 'pending'
+        self.rules = RuleBook(config.RULES_PATH, reload_interval=config.RULES_RELOAD_INTERVAL)
+        self.base_version = self.build_version()
+        self.cache = self.create_cache()
+        self.confidence_threshold = 0.7
+    
+    @property
+    def nlp(self):
+        """spaCy model, được nạp ở lần dùng đầu tiên (None nếu model chưa được cài đặt)"""
+        if not self._nlp_loaded:
+            with self._nlp_lock:
+                if not self._nlp_loaded:
+                    self._nlp = load_spacy_model(config.SPACY_MODEL, config.SPACY_PROFILE)
+                    self._nlp_loaded = True
+        return self._nlp
+    
+    @property
+    def spacy_available(self) -> Optional[bool]:
+        """spaCy model có sẵn hay không, None nếu chưa nạp"""
+        return self._nlp is not None if self._nlp_loaded else None
+    
+    def build_version(self) -> str:
+        """Version stamp của kết quả phân tích (cấu hình + model), dùng trong khóa cache"""
+        parts = [config.CACHE_VERSION]
+        if self._nlp_loaded and self._nlp:
+            # Tên các thành phần pipeline: đổi profile spaCy cũng vô hiệu hóa cache cũ
+            components = '+'.join(self._nlp.pipe_names)
+            parts.append(f"{self._nlp.meta.get('name', 'spacy')}-{self._nlp.meta.get('version', '')}[{components}]")
+        else:
+            # Lấy version từ metadata của package để không phải nạp model khi khởi động
+            parts.append(f"{config.SPACY_MODEL}-{package_version(config.SPACY_MODEL)}[{config.SPACY_PROFILE}]")
+        parts.append(f"underthesea-{package_version('underthesea')}")
+        # Cách phân tích văn bản hỗn hợp thay đổi cấu trúc kết quả
+        parts.append(f"mixed-{config.MIXED_ROUTING}")
+        return '|'.join(parts)
+    
+    def warm_up(self) -> Dict:
+        """Nạp models và chạy văn bản mẫu qua từng nhánh ngôn ngữ, trả về trạng thái các engines"""
+        self.warmup_state = 'running'
+        steps = [
+            ('langdetect', self._warm_langdetect),
+            ('pyvi', self._warm_pyvi),
+            ('underthesea', self._warm_underthesea),
+            ('spacy', self._warm_spacy),
+            ('nltk', self._warm_nltk)
+        ]
+        started = time.monotonic()
+        for name, warm in steps:
+            self._warm_engine(name, warm)
+        self.warmup_state = 'done'
+        logger.info(f"Warm-up hoàn tất trong {time.monotonic() - started:.2f}s: "
+                    + ', '.join(f"{name}={state['status']}" for name, state in self.engines.items()))
+        return self.readiness()
+    
+    def start_warm_up(self) -> threading.Thread:
+        """Chạy warm_up() trong thread nền, request đến trước sẽ tự nạp model cần dùng"""
+        thread = threading.Thread(target=self.warm_up, name='nlp-warmup', daemon=True)
+        thread.start()
+        return thread
+    
+    def schedule_warm_up(self, mode: str):
+        """Warm-up theo chế độ: eager (chờ nạp xong), background (thread nền) hoặc off (chỉ nạp khi cần)"""
+        if mode == 'eager':
+            self.warm_up()
+        elif mode == 'background':
+            self.start_warm_up()
+        elif mode == 'off':
+            self.warmup_state = 'disabled'
+        else:
+            raise ValueError(f"Chế độ warm-up không hợp lệ: {mode} (eager, background, off)")
+    
+    def _warm_engine(self, name: str, warm):
+        """Chạy một bước warm-up và ghi lại trạng thái (warm, unavailable, error) cùng thời gian"""
+        self.engines[name] = {'status': 'loading'}
+        started = time.monotonic()
+        try:
+            available = warm()
+        except Exception as e:
+            # Chỉ giữ dòng đầu tiên có nội dung (lỗi của NLTK có khung '*' nhiều dòng)
+            message = next((line.strip(' *') for line in str(e).splitlines() if line.strip(' *')), '')
+            error = f"{type(e).__name__}: {message}" if message else type(e).__name__
+            logger.error(f"Warm-up {name} thất bại: {error}")
+            self.engines[name] = {'status': 'error', 'error': error, 'seconds': round(time.monotonic() - started, 3)}
+            return
+        self.engines[name] = {
+            'status': 'warm' if available is not False else 'unavailable',
+            'seconds': round(time.monotonic() - started, 3)
+        }
+    
+    def _warm_langdetect(self):
+        # langdetect nạp language profiles ở lần gọi đầu tiên
+        detect = load_langdetect()
+        for sample in WARMUP_SAMPLES.values():
+            detect(sample)
+    
+    def _warm_pyvi(self):
+        load_pyvi()
+        self.segment_vietnamese(WARMUP_SAMPLES['vietnamese'])
+    
+    def _warm_underthesea(self):
+        load_underthesea()
+        self.analyze_vietnamese(WARMUP_SAMPLES['vietnamese'])
+    
+    def _warm_spacy(self):
+        if self.nlp is None:
+            return False
+        self.analyze_english(WARMUP_SAMPLES['english'], use_nltk=False)
+        self.analyze_mixed(WARMUP_SAMPLES['mixed'], use_nltk=False)
+    
+    def _warm_nltk(self):
+        self.pos_tag_with_nltk(self.tokenize_with_nltk(WARMUP_SAMPLES['english']))
+    
+    def readiness(self) -> Dict:
+        """Trạng thái sẵn sàng: warm-up đã xong và các engines bắt buộc đã warm"""
+        engines = {name: dict(state) for name, state in self.engines.items()}
+        if self.warmup_state == 'disabled':
+            ready = True
+        else:
+            ready = self.warmup_state == 'done' and all(engines[name]['status'] == 'warm' for name in REQUIRED_ENGINES)
+        return {
+            'ready': ready,
+            'warmup': self.warmup_state,
+            'engines': engines
+        }
+    
+    @property
+    def version(self) -> str:
+        """Version stamp đầy đủ: cấu hình + model + rules, thay đổi khi rules được nạp lại"""
+        return f"{self.base_version}|rules-{self.rules.version}"
+    
+    def create_cache(self):
+        """Tạo cache trong bộ nhớ, thêm tầng cache trên đĩa nếu được cấu hình"""
+        memory_cache = AnalysisCache(
+            max_entries=config.CACHE_MAX_ENTRIES,
+            max_bytes=config.CACHE_MAX_BYTES,
+            ttl=config.CACHE_TTL_SECONDS,
+            compress=config.CACHE_COMPRESS
+        )
+        if not config.CACHE_PERSISTENT_PATH:
+            return memory_cache
+        
+        try:
+            persistent_cache = SQLiteCache(
+                config.CACHE_PERSISTENT_PATH,
+                version=self.version,
+                max_entries=config.CACHE_PERSISTENT_MAX_ENTRIES,
+                max_bytes=config.CACHE_PERSISTENT_MAX_BYTES,
+                ttl=config.CACHE_PERSISTENT_TTL_SECONDS
+            )
+        except Exception as e:
+            logger.error(f"Không thể mở cache trên đĩa {config.CACHE_PERSISTENT_PATH}: {e}")
+            return memory_cache
+        return TieredCache(memory_cache, persistent_cache)
+        
+    def reload_rules(self, force: bool = False) -> bool:
+        """
+        Nạp lại rules (force=False: chỉ khi đến kỳ kiểm tra file), trả về True nếu có nạp lại.
+        Version mới được đưa vào cache trên đĩa để entries mới mang đúng version và entries cũ bị xóa
+        """
+        reloaded = self.rules.reload(force=True) if force else self.rules.maybe_reload()
+        if reloaded and isinstance(self.cache, TieredCache) and self.cache.persistent.version != self.version:
+            purged = self.cache.persistent.set_version(self.version)
+            logger.info(f"Cache trên đĩa chuyển sang version mới, đã xóa {purged} entries cũ")
+        return reloaded
+    
+    @staticmethod
+    def validate_input(text: str) -> Tuple[bool, str]:
+        """Validate input text (không cần models, dùng được cả ở front end)"""
+        if not text or not isinstance(text, str):
+            return False, "Văn bản không hợp lệ"
+        
+        if len(text.strip()) < 2:
+            return False, "Văn bản quá ngắn"
+        
+        if len(text) > config.MAX_TEXT_CHARS:
+            return False, f"Văn bản quá dài (tối đa {config.MAX_TEXT_CHARS:,} ký tự)"
+        
+        return True, "OK"
+    
+    def calculate_confidence_score(self, entities: List[Dict], tokens: List[str]) -> float:
+        """Tính confidence score cho kết quả phân tích"""
+        if not entities or not tokens:
+            return 0.0
+        
+        # Tính score dựa trên số lượng entities và độ dài văn bản
+        entity_ratio = len(entities) / len(tokens)
+        base_score = min(entity_ratio * 10, 1.0)
+        
+        # Bonus cho entities có description chi tiết
+        detailed_entities = sum(1 for e in entities if e.get('description', '') != e.get('label', ''))
+        detail_bonus = detailed_entities / len(entities) * 0.2
+        
+        return min(base_score + detail_bonus, 1.0)
+    
+    def cached_detect_language(self, text: str, profile: Optional[TextProfile] = None) -> str:
+        """Cached language detection"""
+        return self.detect_language(text, profile)
+    
+    def detect_language(self, text, profile: Optional[TextProfile] = None):
+        """Phát hiện ngôn ngữ của văn bản: quyết định ngay khi văn bản rõ ràng, còn lại dùng langdetect"""
+        profile = profile or profile_text(text)
+        language = profile.confident_language()
+        if language is not None:
+            return language
+        # Đoạn mẫu ở đầu, giữa và cuối văn bản dài; cache theo đoạn mẫu thay vì toàn bộ văn bản
+        return _detect_language_sample(detection_sample(text, config.LANGUAGE_SAMPLE_CHARS))
+    
+    @timed('detection')
+    def classify_text(self, text: str) -> Tuple[bool, str]:
+        """
+        Một lần duyệt văn bản cho cả kiểm tra văn bản hỗn hợp và phát hiện ngôn ngữ.
+        Trả về (có phải văn bản hỗn hợp, ngôn ngữ); văn bản hỗn hợp không cần phát hiện ngôn ngữ.
+        """
+        profile = profile_text(text)
+        if profile.is_mixed:
+            return True, 'mixed'
+        return False, self.cached_detect_language(text, profile)
+    
+    @timed('segmentation')
+    def tokenize_with_nltk(self, text):
+        """Tokenization sử dụng NLTK"""
+        word_tokenize, _ = load_nltk()
+        tokens = word_tokenize(text)
+        return tokens
+    
+    @timed('pos')
+    def pos_tag_with_nltk(self, tokens):
+        """POS tagging sử dụng NLTK"""
+        _, pos_tag = load_nltk()
+        pos_tags = pos_tag(tokens)
+        return pos_tags
+    
+    def token_layer(self, text, spacy_doc=None, use_nltk: Optional[bool] = None,
+                    deadline: Optional[Deadline] = None, layers=None) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """
+        Tokens và POS tags cho nltk_analysis: lấy từ spaCy Doc (cùng bộ tag Penn Treebank),
+        chỉ chạy NLTK riêng khi được yêu cầu hoặc không có spaCy
+        """
+        if not analyzes(layers):
+            return [], []
+        if use_nltk is None:
+            use_nltk = config.NLTK_ANALYSIS
+        if use_nltk or spacy_doc is None:
+            if not _allow(deadline, 'tokenize'):
+                return [], []
+            tokens = self.tokenize_with_nltk(text)
+            if not wants(layers, 'pos') or not _allow(deadline, 'pos'):
+                return tokens, []
+            return tokens, self.pos_tag_with_nltk(tokens)
+        if not wants(layers, 'pos') or (deadline is not None and 'pos' in deadline.skipped):
+            return [token.text for token in spacy_doc if not token.is_space], []
+        pos_tags = [(token.text, token.tag_) for token in spacy_doc if not token.is_space]
+        return [token for token, _ in pos_tags], pos_tags
+    
+    def segment_vietnamese(self, text: str, deadline: Optional[Deadline] = None, layers=None) -> 'VietnameseDocument':
+        """Tách từ và gán nhãn POS tiếng Việt một lần duy nhất bằng pyvi (bỏ POS khi layer pos không được yêu cầu)"""
+        try:
+            ViTokenizer, ViPosTagger = load_pyvi()
+            with STAGE_SECONDS.time(stage='segmentation'):
+                segmented = ViTokenizer.tokenize(text)
+            if not wants(layers, 'pos') or not _allow(deadline, 'pos'):
+                return VietnameseDocument(text, segmented.split(), [])
+            with STAGE_SECONDS.time(stage='pos'):
+                tokens, tags = ViPosTagger.postagging(segmented)
+            tokens = list(tokens)
+            # Sửa các POS tags sai
+            pos_tags = self.correct_vietnamese_pos_tags(list(zip(tokens, tags)))
+        except:
+            # Fallback về NLTK nếu pyvi lỗi
+            tokens = self.tokenize_with_nltk(text)
+            pos_tags = self.pos_tag_with_nltk(tokens) if wants(layers, 'pos') else []
+        return VietnameseDocument(text, tokens, pos_tags)
+    
+    def tokenize_vietnamese(self, text, doc: Optional['VietnameseDocument'] = None):
+        """Tokenization cho tiếng Việt sử dụng pyvi"""
+        doc = doc or self.segment_vietnamese(text)
+        return doc.tokens
+    
+    def pos_tag_vietnamese(self, text, doc: Optional['VietnameseDocument'] = None):
+        """POS tagging cho tiếng Việt sử dụng pyvi"""
+        doc = doc or self.segment_vietnamese(text)
+        return doc.pos_tags
+    
+    def analyze_vietnamese_with_underthesea(self, text, doc: Optional['VietnameseDocument'] = None,
+                                            deadline: Optional[Deadline] = None, layers=None):
+        """Phân tích tiếng Việt sử dụng underthesea (NER chỉ chạy khi layer entities được yêu cầu)"""
+        try:
+            doc = doc or self.segment_vietnamese(text, layers=layers)
+            # Sử dụng POS tags đã được sửa từ bước tách từ dùng chung
+            corrected_pos_tags = doc.pos_tags
+            
+            # Tokenization và POS tagging
+            tokens_with_pos = []
+            
+            for token, pos in corrected_pos_tags:
+                tokens_with_pos.append({
+                    'token': token,
+                    'pos': pos,
+                    'tag': pos,  # underthesea chỉ có POS, không có tag chi tiết
+                    'lemma': token  # underthesea không có lemmatization
+                })
+            
+            # Named Entity Recognition
+            entities = []
+            try:
+                extract = wants(layers, 'entities')
+                ner_results = [entity for entity in doc.ner_results if len(entity) >= 4] if extract and _allow(deadline, 'ner') else []
+                
+                # Ánh xạ token của underthesea về vị trí trong văn bản gốc để có offset thật
+                token_spans = align_tokens(text, [entity[0] for entity in ner_results])
+                
+                # Underthesea trả về (token, pos, chunk_tag, ner_tag)
+                current_entity = ""
+                current_label = ""
+                current_span = None
+                
+                def save_current_entity():
+                    if current_entity and current_label:
+                        entities.append(self._make_vietnamese_entity(text, current_entity, current_label, current_span))
+                
+                for (token, pos, chunk_tag, ner_tag), span in zip((entity[:4] for entity in ner_results), token_spans):
+                    if ner_tag.startswith('B-'):  # Bắt đầu entity mới
+                        # Lưu entity trước đó nếu có
+                        save_current_entity()
+                        
+                        # Bắt đầu entity mới
+                        current_entity = token
+                        current_label = ner_tag[2:]  # Bỏ 'B-' prefix
+                        current_span = span
+                        
+                    elif ner_tag.startswith('I-') and current_label == ner_tag[2:]:  # Tiếp tục entity
+                        # Chỉ thêm token nếu không phải dấu câu
+                        if token not in [',', '.', '!', '?', ';', ':']:
+                            current_entity += " " + token
+                            if current_span is not None and span is not None:
+                                current_span = (current_span[0], span[1])
+                            else:
+                                current_span = None
+                        
+                    else:  # Không phải entity hoặc kết thúc entity
+                        # Lưu entity trước đó nếu có
+                        save_current_entity()
+                        current_entity = ""
+                        current_label = ""
+                        current_span = None
+                
+                # Lưu entity cuối cùng nếu có
+                save_current_entity()
+                
+                # Làm sạch entities: loại bỏ entities quá ngắn hoặc chỉ chứa dấu câu
+                apply_rules = extract and _allow(deadline, 'rules')
+                cleaned_entities = []
+                for entity in entities:
+                    if len(entity['text']) > 1:
+                        # Sửa nhãn sai dựa trên context và từ khóa
+                        if apply_rules:
+                            entity = self.correct_vietnamese_ner_labels(entity)
+                        
+                        cleaned_entities.append(entity)
+                
+                # Thêm các entities bị thiếu
+                additional_entities = self.add_missing_vietnamese_entities(text, cleaned_entities) if apply_rules else []
+                entities = cleaned_entities + additional_entities
+                    
+            except Exception as e:
+                pass  # NER có thể không hoạt động với một số phiên bản
+            
+            return {
+                'tokens_with_pos': tokens_with_pos,
+                'entities': entities
+            }
+        except Exception as e:
+            print(f"Lỗi khi phân tích tiếng Việt với underthesea: {e}")
+            return None
+    
+    def _make_vietnamese_entity(self, text, entity_text, label, span) -> Dict:
+        """Tạo entity tiếng Việt, bỏ dấu câu/khoảng trắng ở hai đầu cả trong văn bản lẫn offset"""
+        # Loại bỏ dấu câu và khoảng trắng ở đầu và cuối
+        clean_text = entity_text.strip().strip(',.!?;:').strip()
+        start, end = span if span is not None else (0, 0)
+        if span is not None:
+            while start < end and (text[start].isspace() or text[start] in ',.!?;:'):
+                start += 1
+            while end > start and (text[end - 1].isspace() or text[end - 1] in ',.!?;:'):
+                end -= 1
+        return {
+            'text': clean_text,
+            'label': label,
+            'start': start,
+            'end': end,
+            'description': self.get_vietnamese_ner_description(label)
+        }
+    
+    def get_vietnamese_ner_description(self, ner_tag):
+        """Lấy mô tả cho NER tag tiếng Việt"""
+        descriptions = {
+            'PER': 'Tên người',
+            'LOC': 'Địa điểm',
+            'ORG': 'Tổ chức',
+            'MISC': 'Khác',
+            'NP': 'Cụm danh từ',
+            'DATE': 'Ngày tháng',
+            'O': 'Không phải entity'
+        }
+        return descriptions.get(ner_tag, ner_tag)
+    
+    def get_vietnamese_pos_description(self, pos_tag):
+        """Lấy mô tả chi tiết cho POS tag tiếng Việt"""
+        descriptions = {
+            # Danh từ
+            'N': 'Danh từ chung (Noun)',
+            'Np': 'Danh từ riêng (Proper Noun)',
+            'Nu': 'Danh từ đơn vị (Unit Noun)',
+            'Nc': 'Danh từ chỉ loại (Classifier Noun)',
+            
+            # Động từ
+            'V': 'Động từ (Verb)',
+            'Vb': 'Động từ bổ trợ (Auxiliary Verb)',
+            'Vv': 'Động từ vị ngữ (Predicative Verb)',
+            
+            # Tính từ
+            'A': 'Tính từ (Adjective)',
+            'Ab': 'Tính từ bổ trợ (Auxiliary Adjective)',
+            
+            # Đại từ
+            'P': 'Đại từ (Pronoun)',
+            'Pp': 'Đại từ nhân xưng (Personal Pronoun)',
+            'Pd': 'Đại từ chỉ định (Demonstrative Pronoun)',
+            'Pq': 'Đại từ nghi vấn (Interrogative Pronoun)',
+            
+            # Số từ
+            'M': 'Số từ (Numeral)',
+            'Mc': 'Số từ chỉ số lượng (Cardinal Numeral)',
+            'Mo': 'Số từ thứ tự (Ordinal Numeral)',
+            
+            # Phó từ
+            'R': 'Phó từ (Adverb)',
+            'Rg': 'Phó từ chỉ mức độ (Degree Adverb)',
+            'Rr': 'Phó từ chỉ thời gian (Time Adverb)',
+            'Rs': 'Phó từ chỉ nơi chốn (Place Adverb)',
+            
+            # Giới từ
+            'E': 'Giới từ (Preposition)',
+            'Ec': 'Giới từ chỉ nơi chốn (Place Preposition)',
+            'Et': 'Giới từ chỉ thời gian (Time Preposition)',
+            
+            # Liên từ
+            'C': 'Liên từ (Conjunction)',
+            'Cc': 'Liên từ kết hợp (Coordinating Conjunction)',
+            'Cs': 'Liên từ phụ thuộc (Subordinating Conjunction)',
+            
+            # Thán từ
+            'I': 'Thán từ (Interjection)',
+            
+            # Trợ từ
+            'T': 'Trợ từ (Particle)',
+            'Td': 'Trợ từ định ngữ (Determiner Particle)',
+            'Tg': 'Trợ từ ngữ khí (Modal Particle)',
+            
+            # Dấu câu
+            'CH': 'Dấu câu (Punctuation)',
+            'CHp': 'Dấu chấm (Period)',
+            'CHc': 'Dấu phẩy (Comma)',
+            'CHh': 'Dấu hỏi (Question Mark)',
+            'CHk': 'Dấu chấm than (Exclamation Mark)',
+            
+            # Từ ngoại lai
+            'FW': 'Từ ngoại lai (Foreign Word)',
+            
+            # Khác
+            'X': 'Từ khác (Other)',
+            'Y': 'Từ viết tắt (Abbreviation)',
+            'Z': 'Từ không xác định (Unknown)'
+        }
+        return descriptions.get(pos_tag, f'{pos_tag} (Không xác định)')
+    
+    def correct_vietnamese_ner_labels(self, entity):
+        """Sửa các nhãn NER sai dựa trên context và từ khóa (rules trong rules.json)"""
+        return self.rules.correct_entity('vietnamese_ner', entity, self.get_vietnamese_ner_description)
+    
+    @timed('rules')
+    def add_missing_vietnamese_entities(self, text, existing_entities):
+        """
+        Thêm các entities bị thiếu dựa trên từ khóa và pattern.
+        Toàn bộ gazetteer được quét trong một lần duyệt (Aho–Corasick), các số (tuổi, tỷ số,
+        năm, dân số, giường bệnh) qua một regex đã biên dịch sẵn; entities có offset thật và
+        được gộp với entities đã có theo vị trí (bỏ các entities chồng lấn).
+        """
+        candidates = []
+        text_lower = lower_preserving_offsets(text)
+        
+        def add(start, end, entity_text, label, description):
+            candidates.append({
+                'text': entity_text,
+                'label': label,
+                'start': start,
+                'end': end,
+                'description': description
+            })
+        
+        # Gazetteer: tên người, trường, quận, bằng cấp, đơn vị, chức vụ, địa điểm...
+        scanner = self.rules.scanner('vietnamese_gazetteer')
+        for start, end, term, category in scanner.scan(text_lower):
+            add(start, end, scanner.format_term(term, category), category['label'], category.get('description', category['label']))
+        
+        # Số: tuổi, giường bệnh, dân số, tỷ số, năm và đơn vị 1 ký tự (5g, 10m)
+        single_units_seen = set()
+        for match in NUMBER_LEXER.finditer(text_lower):
+            number, number2, unit = match.group('number', 'number2', 'unit')
+            number_start, number_end = match.span('number')
+            
+            if number2 is not None:
+                add(number_start, match.end('number2'), f"{number}-{number2}", 'NUM', 'Tỷ số')
+            
+            for year, (year_start, year_end) in ((number, (number_start, number_end)), (number2, match.span('number2'))):
+                if year is not None and YEAR_PATTERN.fullmatch(year):
+                    add(year_start, year_end, year, 'NUM', 'Năm')
+            
+            if unit is None:
+                continue
+            unit = ' '.join(unit.split())
+            if unit == 'tuổi':
+                add(number_start, number_end, number, 'NUM', 'Số tuổi')
+            elif unit == 'giường bệnh':
+                add(number_start, number_end, number, 'NUM', 'Số lượng')
+            elif unit in ('triệu', 'nghìn', 'tỷ'):
+                add(number_start, match.end('unit'), f"{number} {unit}", 'NUM', 'Dân số')
+            elif unit not in single_units_seen:
+                single_units_seen.add(unit)
+                add(match.start('unit'), match.end('unit'), unit.upper(), 'MISC', 'Đơn vị đo lường')
+        
+        # Tên người đầy đủ (Nguyễn Văn Minh) và tên người nước ngoài (Park Hang-seo)
+        for pattern in (FULL_NAME_PATTERN, FOREIGN_NAME_PATTERN):
+            for match in pattern.finditer(text_lower):
+                first_name, second_name = match.groups()
+                add(match.start(), match.end(), f"{first_name.title()} {second_name.title()}", 'PER', 'Tên người')
+        
+        # Gộp theo vị trí: O(n log n) thay vì so sánh chuỗi với từng entity đã có
+        return merge_entities(existing_entities, candidates)
+    
+    @timed('rules')
+    def correct_vietnamese_pos_tags(self, pos_tags):
+        """Sửa các POS tags sai dựa trên context và từ khóa (rules trong rules.json)"""
+        return self.rules.correct_pos_tags('vietnamese_pos', pos_tags)
+    
+    def correct_english_ner_labels(self, entity):
+        """Sửa các nhãn NER tiếng Anh sai dựa trên context và từ khóa (rules trong rules.json)"""
+        return self.rules.correct_entity('english_ner', entity)
+    
+    @timed('rules')
+    def add_missing_english_entities(self, text, existing_entities):
+        """Thêm các entities bị thiếu cho tiếng Anh"""
+        additional_entities = []
+        text_lower = text.lower()
+        
+        import re
+        
+        # Kiểm tra các chức vụ
+        job_titles = ['ceo', 'president', 'coach', 'mvp', 'software engineer', 'champion']
+        for title in job_titles:
+            if title in text_lower and not any(title in entity['text'].lower() for entity in existing_entities):
+                additional_entities.append({
+                    'text': title.title(),
+                    'label': 'MISC',
+                    'start': 0,
+                    'end': 0,
+                    'description': 'Job title'
+                })
+        
+        # Kiểm tra các sự kiện thể thao
+        sports_events = ['championship', 'finals', 'nba']
+        for event in sports_events:
+            if event in text_lower and not any(event in entity['text'].lower() for entity in existing_entities):
+                if event == 'nba':
+                    additional_entities.append({
+                        'text': 'NBA',
+                        'label': 'ORG',
+                        'start': 0,
+                        'end': 0,
+                        'description': 'Sports organization'
+                    })
+                else:
+                    additional_entities.append({
+                        'text': event.title(),
+                        'label': 'EVENT',
+                        'start': 0,
+                        'end': 0,
+                        'description': 'Sports event'
+                    })
+        
+        # Kiểm tra công nghệ
+        if 'ai' in text_lower and not any('ai' in entity['text'].lower() for entity in existing_entities):
+            additional_entities.append({
+                'text': 'AI',
+                'label': 'MISC',
+                'start': 0,
+                'end': 0,
+                'description': 'Technology'
+            })
+        
+        return additional_entities
+    
+    def spacy_disabled(self, layers=None) -> List[str]:
+        """Các thành phần spaCy không cần cho layers được yêu cầu; tok2vec chỉ bị tắt khi mọi thành phần dùng nó đều tắt"""
+        if layers is None or not self.nlp:
+            return []
+        skipped = {name for layer, names in SPACY_LAYER_COMPONENTS.items() if layer not in layers for name in names}
+        for name, component in self.nlp.pipeline:
+            listeners = getattr(component, 'listening_components', None)
+            if listeners is not None and all(listener in skipped for listener in listeners):
+                skipped.add(name)
+        return [name for name in self.nlp.pipe_names if name in skipped]
+    
+    @timed('spacy')
+    def run_spacy(self, text, deadline: Optional[Deadline] = None, layers=None):
+        """Chạy spaCy pipeline; khi có deadline, chạy từng thành phần và kiểm tra thời gian còn lại giữa chúng"""
+        disabled = self.spacy_disabled(layers)
+        if deadline is None:
+            return self.nlp(text, disable=disabled) if disabled else self.nlp(text)
+        if not deadline.allow('tokenize'):
+            return None
+        doc = self.nlp.make_doc(text)
+        for name, component in self.nlp.pipeline:
+            if name not in disabled and deadline.allow('ner' if name == 'ner' else 'pos'):
+                doc = component(doc)
+        return doc
+    
+    def analyze_with_spacy(self, text, doc=None, deadline: Optional[Deadline] = None, layers=None):
+        """Phân tích văn bản sử dụng spaCy (có thể truyền Doc đã xử lý sẵn từ nlp.pipe)"""
+        if not self.nlp:
+            return None
+        
+        if doc is None:
+            doc = self.run_spacy(text, deadline, layers)
+        if doc is None:
+            return {'tokens_with_pos': [], 'entities': []}
+        
+        # Tokenization và POS tagging
+        tokens_with_pos = []
+        for token in (doc if wants(layers, 'pos') else ()):
+            tokens_with_pos.append({
+                'token': token.text,
+                'pos': token.pos_,
+                'tag': token.tag_,
+                'lemma': token.lemma_
+            })
+        
+        # Named Entity Recognition
+        from spacy import explain
+        extract = wants(layers, 'entities')
+        apply_rules = extract and _allow(deadline, 'rules')
+        entities = []
+        for ent in (doc.ents if extract else ()):
+            entity = {
+                'text': ent.text,
+                'label': ent.label_,
+                'start': ent.start_char,
+                'end': ent.end_char,
+                'description': explain(ent.label_)
+            }
+            
+            # Sửa các nhãn NER sai
+            if apply_rules:
+                entity = self.correct_english_ner_labels(entity)
+            entities.append(entity)
+        
+        # Thêm các entities bị thiếu
+        if apply_rules:
+            additional_entities = self.add_missing_english_entities(text, entities)
+            entities.extend(additional_entities)
+        
+        return {
+            'tokens_with_pos': tokens_with_pos,
+            'entities': entities
+        }
+    
+    def is_mixed_language_text(self, text) -> bool:
+        """Kiểm tra văn bản có phải hỗn hợp (tiếng Việt + tiếng Anh) hay không"""
+        return profile_text(text).is_mixed
+    
+    def analyze_mixed_language_text(self, text, spacy_doc=None, use_nltk: Optional[bool] = None):
+        """Phân tích văn bản hỗn hợp (tiếng Việt + tiếng Anh)"""
+        if not self.is_mixed_language_text(text):
+            return None
+        return self.analyze_mixed(text, spacy_doc, use_nltk)
+    
+    def analyze_mixed(self, text, spacy_doc=None, use_nltk: Optional[bool] = None,
+                      deadline: Optional[Deadline] = None, layers=None) -> Dict:
+        """
+        Phân tích văn bản đã được xác định là hỗn hợp: mặc định tách theo đoạn ngôn ngữ,
+        NLP_MIXED_ROUTING=whole (hoặc khi đã có spaCy Doc của cả văn bản) chạy spaCy trên toàn bộ văn bản
+        """
+        if config.MIXED_ROUTING == 'segments' and spacy_doc is None:
+            return self.analyze_mixed_segments(text, use_nltk, deadline, layers)
+        return self.analyze_mixed_whole(text, spacy_doc, use_nltk, deadline, layers)
+    
+    def analyze_mixed_segments(self, text, use_nltk: Optional[bool] = None,
+                               deadline: Optional[Deadline] = None, layers=None) -> Dict:
+        """
+        Phân tích văn bản hỗn hợp theo từng đoạn: đoạn tiếng Việt qua pyvi/underthesea, đoạn tiếng Anh qua spaCy
+        (theo lô bằng nlp.pipe). Hai nhóm chạy song song, kết quả được ghép lại với offset theo văn bản gốc
+        """
+        runs = split_language_runs(text)
+        vietnamese_runs = [(start, end) for start, end, language in runs if language == 'vi']
+        english_runs = [(start, end) for start, end, language in runs if language == 'en']
+        
+        def analyze_vietnamese_runs():
+            return [
+                self.analyze_vietnamese(text[start:end], 'vi', deadline=deadline, layers=layers)
+                for start, end in vietnamese_runs
+            ]
+        
+        def analyze_english_runs():
+            run_texts = [text[start:end] for start, end in english_runs]
+            if run_texts and deadline is None and analyzes(layers) and self.nlp:
+                with STAGE_SECONDS.time(stage='spacy'):
+                    spacy_docs = list(self.nlp.pipe(run_texts, disable=self.spacy_disabled(layers)))
+            else:
+                spacy_docs = [None] * len(run_texts)
+            return [
+                self.analyze_english(run_text, 'en', spacy_doc, use_nltk, deadline, layers)
+                for run_text, spacy_doc in zip(run_texts, spacy_docs)
+            ]
+        
+        if vietnamese_runs and english_runs:
+            # Thread riêng cho mỗi lần gọi: không giữ thread sống qua fork của gunicorn (preload_app)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # Chuyển context (ví dụ trace profiling của request) sang thread phân tích tiếng Việt
+                vietnamese_future = executor.submit(contextvars.copy_context().run, analyze_vietnamese_runs)
+                english_results = analyze_english_runs()
+                vietnamese_results = vietnamese_future.result()
+        else:
+            vietnamese_results = analyze_vietnamese_runs()
+            english_results = analyze_english_runs()
+        
+        run_results = dict(zip(vietnamese_runs, vietnamese_results))
+        run_results.update(zip(english_runs, english_results))
+        
+        # Ghép kết quả theo thứ tự các đoạn, dời offset entities về vị trí trong văn bản gốc
+        tokens, pos_tags, tokens_with_pos, entities, segments = [], [], [], [], []
+        for start, end, language in runs:
+            run_result = run_results[(start, end)]
+            tokens.extend(run_result['nltk_analysis']['tokens'])
+            pos_tags.extend(run_result['nltk_analysis']['pos_tags'])
+            run_analysis = run_result['spacy_analysis'] or {}
+            tokens_with_pos.extend(run_analysis.get('tokens_with_pos', []))
+            for entity in run_analysis.get('entities', []):
+                if has_span(entity):
+                    entity = dict(entity, start=entity['start'] + start, end=entity['end'] + start)
+                entities.append(entity)
+            segments.append({'start': start, 'end': end, 'language': run_result['language']})
+        entities.sort(key=lambda entity: entity.get('start', 0))
+        
+        return {
+            'language': 'mixed',
+            'detected_language': 'mixed',
+            'nltk_analysis': {
+                'tokens': tokens,
+                'pos_tags': pos_tags
+            },
+            'spacy_analysis': {
+                'tokens_with_pos': tokens_with_pos,
+                'entities': entities
+            },
+            'segments': segments,
+            'confidence_score': self.calculate_confidence_score(entities, tokens)
+        }
+    
+    def analyze_mixed_whole(self, text, spacy_doc=None, use_nltk: Optional[bool] = None,
+                            deadline: Optional[Deadline] = None, layers=None) -> Dict:
+        """Phân tích văn bản hỗn hợp bằng spaCy trên toàn bộ văn bản, sửa nhãn theo rules mixed_ner"""
+        if spacy_doc is None and analyzes(layers) and self.nlp:
+            spacy_doc = self.run_spacy(text, deadline, layers)
+        
+        # Tokens/POS lấy từ spaCy Doc (hoặc NLTK nếu được yêu cầu)
+        nltk_tokens, nltk_pos_tags = self.token_layer(text, spacy_doc, use_nltk, deadline, layers)
+        
+        # Sử dụng spaCy cho NER (tốt hơn cho tiếng Anh)
+        spacy_analysis = self.analyze_with_spacy(text, spacy_doc, deadline, layers) if analyzes(layers) else None
+        
+        # Thêm logic correction cho văn bản hỗn hợp
+        if spacy_analysis and 'entities' in spacy_analysis and wants(layers, 'entities') and _allow(deadline, 'rules'):
+            corrected_entities = []
+            with STAGE_SECONDS.time(stage='rules'):
+                for entity in spacy_analysis['entities']:
+                    # Sửa các lỗi cho văn bản hỗn hợp
+                    entity = self.correct_mixed_language_ner_labels(entity, text)
+                    corrected_entities.append(entity)
+            spacy_analysis['entities'] = corrected_entities
+        
+        result = {
+            'language': 'mixed',
+            'detected_language': 'mixed',
+            'nltk_analysis': {
+                'tokens': nltk_tokens,
+                'pos_tags': nltk_pos_tags
+            },
+            'spacy_analysis': spacy_analysis
+        }
+        
+        # Tính confidence score
+        entities = (spacy_analysis or {}).get('entities', [])
+        result['confidence_score'] = self.calculate_confidence_score(entities, nltk_tokens)
+        return result
+    
+    def analyze_vietnamese(self, text, detected_language='vi', doc: Optional[VietnameseDocument] = None,
+                           deadline: Optional[Deadline] = None, layers=None) -> Dict:
+        """Phân tích văn bản tiếng Việt: tách từ một lần, dùng chung cho token, POS và NER"""
+        if doc is None:
+            if analyzes(layers) and _allow(deadline, 'tokenize'):
+                doc = self.segment_vietnamese(text, deadline, layers)
+            else:
+                doc = VietnameseDocument(text, [], [])
+        vietnamese_tokens = doc.tokens
+        vietnamese_pos_tags = doc.pos_tags
+        underthesea_analysis = self.analyze_vietnamese_with_underthesea(text, doc, deadline, layers) if analyzes(layers) else None
+        
+        result = {
+            'language': 'vietnamese',
+            'detected_language': detected_language,
+            'nltk_analysis': {
+                'tokens': vietnamese_tokens,
+                'pos_tags': vietnamese_pos_tags
+            },
+            'spacy_analysis': underthesea_analysis,
+            'vietnamese_analysis': {
+                'tokens': vietnamese_tokens,
+                'pos_tags': vietnamese_pos_tags,
+                'underthesea_analysis': underthesea_analysis
+            }
+        }
+        
+        # Tính confidence score
+        entities = underthesea_analysis.get('entities', []) if underthesea_analysis else []
+        result['confidence_score'] = self.calculate_confidence_score(entities, vietnamese_tokens)
+        return result
+    
+    def analyze_english(self, text, detected_language='en', spacy_doc=None, use_nltk: Optional[bool] = None,
+                        deadline: Optional[Deadline] = None, layers=None) -> Dict:
+        """Phân tích văn bản tiếng Anh (hoặc ngôn ngữ khác), spaCy chỉ chạy một lần cho cả token, POS và NER"""
+        if spacy_doc is None and analyzes(layers) and self.nlp:
+            spacy_doc = self.run_spacy(text, deadline, layers)
+        nltk_tokens, nltk_pos_tags = self.token_layer(text, spacy_doc, use_nltk, deadline, layers)
+        spacy_analysis = self.analyze_with_spacy(text, spacy_doc, deadline, layers) if analyzes(layers) else None
+        
+        result = {
+            'language': 'english',
+            'detected_language': detected_language,
+            'nltk_analysis': {
+                'tokens': nltk_tokens,
+                'pos_tags': nltk_pos_tags
+            },
+            'spacy_analysis': spacy_analysis
+        }
+        
+        # Tính confidence score
+        entities = spacy_analysis.get('entities', []) if spacy_analysis else []
+        result['confidence_score'] = self.calculate_confidence_score(entities, nltk_tokens)
+        return result
+    
+    def correct_mixed_language_ner_labels(self, entity, full_text):
+        """Sửa các nhãn NER cho văn bản hỗn hợp (rules trong rules.json)"""
+        return self.rules.correct_entity('mixed_ner', entity)
+    
+    def cache_key(self, text: str, use_nltk: Optional[bool] = None) -> str:
+        """
+        Khóa cache theo nội dung, version phân tích và nguồn của nltk_analysis.
+        Cũng là khóa nội dung của kết quả (ETag, GET /analyze/<khóa>)
+        """
+        if use_nltk is None:
+            use_nltk = config.NLTK_ANALYSIS
+        if use_nltk:
+            return make_cache_key(text, self.version, 'nltk')
+        return make_cache_key(text, self.version)
+    
+    @staticmethod
+    def layer_cache_key(text_hash: str, layer: str) -> str:
+        """Khóa cache của một layer, suy ra từ khóa của kết quả đầy đủ"""
+        return make_cache_key(text_hash, f'layer-{layer}')
+    
+    def cached_layers(self, text_hash: str, layers=None) -> Tuple[Optional[Dict], Dict[str, Dict]]:
+        """
+        Tra cache cho các layers được yêu cầu (None = đầy đủ): dùng kết quả đầy đủ nếu có,
+        ngược lại ghép từ các layer được lưu riêng. Trả về (kết quả hoặc None, các layer đã có trong cache)
+        Kết quả đầy đủ ghép được từ các layer được lưu lại thành một entry.
+        Mỗi lần gọi được tính đúng một lượt tra: hit nếu có kết quả (đầy đủ hoặc ghép được), ngược lại miss
+        """
+        cached_result = self.cache.get(text_hash, count=False)
+        if cached_result is not None:
+            self.cache.record_lookup(True)
+            return with_layers(cached_result, layers), {}
+        
+        requested = layers or LAYERS
+        fragments = {}
+        for layer in requested:
+            fragment = self.cache.get(self.layer_cache_key(text_hash, layer), count=False)
+            if fragment is not None:
+                fragments[layer] = fragment
+        complete = len(fragments) == len(requested)
+        self.cache.record_lookup(complete)
+        if complete:
+            merged = merge_layers(fragments.values())
+            if layers is None:
+                self.cache.set(text_hash, merged)
+            return with_layers(merged, layers), fragments
+        return None, fragments
+    
+    def missing_layers(self, layers, fragments: Dict[str, Dict]):
+        """Các layers cần phân tích (None = đầy đủ), language luôn được tính lại vì dùng để chọn nhánh"""
+        if layers is None and not fragments:
+            return None
+        missing = frozenset(layers or LAYERS) - set(fragments) | {'language'}
+        return None if len(missing) == len(LAYERS) else missing
+    
+    def store_layers(self, text_hash: str, result: Dict, computed, layers, fragments: Dict[str, Dict]) -> Dict:
+        """
+        Lưu kết quả vừa phân tích: đầy đủ thành một entry, một phần thành từng entry theo layer.
+        Ghép với các layer đã có trong cache; đủ mọi layer thì lưu thêm thành kết quả đầy đủ
+        """
+        if computed is None:
+            self.cache.set(text_hash, result)
+            return with_layers(result, layers)
+        
+        for layer in computed:
+            self.cache.set(self.layer_cache_key(text_hash, layer), select_layers(result, [layer]))
+        merged = merge_layers([*fragments.values(), select_layers(result, computed)])
+        if layers is None:
+            self.cache.set(text_hash, merged)
+        return with_layers(merged, layers)
+    
+    def analyze_text(self, text: str, use_nltk: Optional[bool] = None,
+                     deadline: Optional[Deadline] = None, use_cache: bool = True, layers=None) -> Optional[Dict]:
+        """
+        Phân tích văn bản hoàn chỉnh với hỗ trợ đa ngôn ngữ
+        use_nltk=True chạy NLTK riêng cho nltk_analysis thay vì lấy từ spaCy (mặc định theo config)
+        deadline: khi hết thời gian, trả về kết quả của các bước đã xong kèm 'partial' và 'skipped_stages'
+        use_cache=False luôn phân tích lại (ví dụ khi profiling), kết quả vẫn được lưu vào cache
+        layers: tập layers cần trả về (xem layers.parse_layers, None = đầy đủ), chỉ các bước cần thiết được chạy
+        """
+        # Validate input
+        is_valid, error_msg = self.validate_input(text)
+        if not is_valid:
+            logger.warning(f"Input validation failed: {error_msg}")
+            return None
+        
+        # Nạp lại rules nếu file đã thay đổi (version mới => khóa cache mới)
+        self.reload_rules()
+        
+        # Check cache (kết quả đầy đủ hoặc ghép từ các layer đã lưu)
+        text_hash = self.cache_key(text, use_nltk)
+        cached_result, fragments = self.cached_layers(text_hash, layers) if use_cache else (None, {})
+        if cached_result is not None:
+            logger.debug("Returning cached result")
+            return cached_result
+        computed = self.missing_layers(layers, fragments)
+        
+        try:
+            if not _allow(deadline, 'language'):
+                result = {
+                    'language': 'unknown',
+                    'detected_language': 'unknown',
+                    'nltk_analysis': {'tokens': [], 'pos_tags': []},
+                    'spacy_analysis': None,
+                    'confidence_score': 0.0
+                }
+            else:
+                # Kiểm tra văn bản hỗn hợp và phát hiện ngôn ngữ trong một lần duyệt
+                is_mixed, detected_language = self.classify_text(text)
+                if is_mixed:
+                    result = self.analyze_mixed(text, use_nltk=use_nltk, deadline=deadline, layers=computed)
+                elif detected_language == 'vi':
+                    result = self.analyze_vietnamese(text, detected_language, deadline=deadline, layers=computed)
+                else:
+                    result = self.analyze_english(text, detected_language, use_nltk=use_nltk, deadline=deadline,
+                                                  layers=computed)
+            
+            ANALYSES.inc(language=result['language'])
+            if deadline is not None and deadline.partial:
+                # Kết quả chưa đầy đủ: trả về ngay, không lưu cache
+                result['partial'] = True
+                result['skipped_stages'] = deadline.skipped_stages()
+                logger.info(f"Deadline exceeded, skipped stages: {', '.join(result['skipped_stages'])}")
+                if computed is None:
+                    return with_layers(result, layers)
+                return with_layers(merge_layers([*fragments.values(), select_layers(result, computed)]), layers)
+            
+            # Cache result
+            return self.store_layers(text_hash, result, computed, layers, fragments)
+                
+        except Exception as e:
+            logger.error(f"Error in analyze_text: {str(e)}")
+            return None
+    
+    def analyze_batch(self, texts: List[str], batch_size: Optional[int] = None, use_nltk: Optional[bool] = None,
+                      layers=None) -> List[Dict]:
+        """
+        Phân tích nhiều văn bản một lần: loại bỏ trùng lặp, kiểm tra cache,
+        nhóm theo ngôn ngữ và dùng nlp.pipe cho văn bản tiếng Anh/hỗn hợp.
+        Trả về danh sách {'success', 'result'} hoặc {'success', 'error'} theo đúng thứ tự đầu vào.
+        layers: như analyze_text, áp dụng cho mọi văn bản trong lô
+        """
+        batch_size = batch_size or config.BATCH_SIZE
+        items: List[Optional[Dict]] = [None] * len(texts)
+        self.reload_rules()
+        
+        # Validate và gom các văn bản trùng nhau (theo khóa cache)
+        positions: Dict[str, List[int]] = {}
+        unique_texts: Dict[str, str] = {}
+        for index, text in enumerate(texts):
+            if isinstance(text, str):
+                text = text.strip()
+            is_valid, error_msg = self.validate_input(text)
+            if not is_valid:
+                items[index] = {'success': False, 'error': error_msg}
+                continue
+            
+            text_hash = self.cache_key(text, use_nltk)
+            if text_hash not in positions:
+                positions[text_hash] = []
+                unique_texts[text_hash] = text
+            positions[text_hash].append(index)
+        
+        # Kiểm tra cache, nhóm các văn bản chưa có theo ngôn ngữ
+        results: Dict[str, Dict] = {}
+        fragments: Dict[str, Dict[str, Dict]] = {}
+        vietnamese_misses: List[Tuple[str, str]] = []
+        spacy_misses: List[Tuple[str, str, bool]] = []
+        mixed_misses: List[str] = []
+        for text_hash, text in unique_texts.items():
+            cached_result, fragments[text_hash] = self.cached_layers(text_hash, layers)
+            if cached_result is not None:
+                results[text_hash] = {'success': True, 'result': cached_result}
+                continue
+            
+            try:
+                is_mixed, detected_language = self.classify_text(text)
+                if is_mixed and config.MIXED_ROUTING == 'segments':
+                    mixed_misses.append(text_hash)
+                elif is_mixed:
+                    spacy_misses.append((text_hash, 'mixed', True))
+                elif detected_language == 'vi':
+                    vietnamese_misses.append((text_hash, detected_language))
+                else:
+                    spacy_misses.append((text_hash, detected_language, False))
+            except Exception as e:
+                logger.error(f"Error routing batch item: {str(e)}")
+                results[text_hash] = {'success': False, 'error': 'Không thể phân tích văn bản'}
+        
+        # Mọi văn bản chưa có trong cache được phân tích với cùng các layers (để dùng chung nlp.pipe);
+        # các layer đã có của từng văn bản vẫn được ghép vào kết quả
+        computed = self.missing_layers(layers, {})
+        
+        def run_item(text_hash, analyze):
+            return self._run_batch_item(text_hash, analyze, computed, layers, fragments[text_hash])
+        
+        # Tiếng Việt: tách từ và NER từng văn bản (pyvi/underthesea không có API theo lô)
+        for text_hash, detected_language in vietnamese_misses:
+            results[text_hash] = run_item(
+                text_hash, lambda text=unique_texts[text_hash]: self.analyze_vietnamese(text, detected_language, layers=computed)
+            )
+        
+        # Văn bản hỗn hợp được tách theo đoạn ngôn ngữ: mỗi văn bản tự gom các đoạn tiếng Anh vào nlp.pipe
+        for text_hash in mixed_misses:
+            results[text_hash] = run_item(
+                text_hash, lambda text=unique_texts[text_hash]: self.analyze_mixed(text, use_nltk=use_nltk, layers=computed)
+            )
+        
+        # Tiếng Anh (và văn bản hỗn hợp khi NLP_MIXED_ROUTING=whole): spaCy xử lý theo lô bằng nlp.pipe
+        if spacy_misses:
+            spacy_texts = [unique_texts[text_hash] for text_hash, _, _ in spacy_misses]
+            if analyzes(computed) and self.nlp:
+                spacy_docs = self.nlp.pipe(spacy_texts, batch_size=batch_size, disable=self.spacy_disabled(computed))
+            else:
+                spacy_docs = iter([None] * len(spacy_texts))
+            for (text_hash, detected_language, is_mixed), text in zip(spacy_misses, spacy_texts):
+                try:
+                    with STAGE_SECONDS.time(stage='spacy'):
+                        spacy_doc = next(spacy_docs)
+                except StopIteration:
+                    spacy_doc = None
+                except Exception as e:
+                    logger.error(f"Error in nlp.pipe: {str(e)}")
+                    spacy_doc = None
+                if is_mixed:
+                    results[text_hash] = run_item(
+                        text_hash, lambda text=text, doc=spacy_doc: self.analyze_mixed(text, doc, use_nltk, layers=computed)
+                    )
+                else:
+                    results[text_hash] = run_item(
+                        text_hash, lambda text=text, doc=spacy_doc, lang=detected_language: self.analyze_english(
+                            text, lang, doc, use_nltk, layers=computed
+                        )
+                    )
+        
+        # Trả kết quả về đúng vị trí đầu vào (kể cả các bản trùng)
+        for text_hash, indexes in positions.items():
+            for index in indexes:
+                items[index] = results[text_hash]
+        return items
+    
+    def _run_batch_item(self, text_hash: str, analyze, computed=None, layers=None,
+                        fragments: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Chạy phân tích một phần tử trong lô, lưu cache và bắt lỗi riêng cho phần tử đó"""
+        try:
+            result = analyze()
+        except Exception as e:
+            logger.error(f"Error in analyze_batch: {str(e)}")
+            return {'success': False, 'error': 'Không thể phân tích văn bản'}
+        ANALYSES.inc(language=result['language'])
+        result = self.store_layers(text_hash, result, computed, layers, fragments or {})
+        return {'success': True, 'result': result}
@@ -0,0 +1,515 @@
+"""
+Chế độ phục vụ asyncio (ASGI): event loop chỉ nhận request, phân tích chạy trong một pool process có giới hạn.
+Khi hàng đợi đầy, request bị từ chối ngay bằng 503 kèm Retry-After thay vì dồn lại và làm tăng độ trễ
+
+Chạy: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import config
+from analyzer import TextAnalyzer
+from deadline import Deadline, parse_deadline_ms
+from layers import parse_layers
+from logs import log_request, setup_logging
+from metrics import (CONTENT_TYPE, IN_FLIGHT, REGISTRY, REQUEST_BYTES, REQUEST_SECONDS, REQUESTS, Counter, Gauge,
+                     Metric)
+from profiling import parse_profile_mode, profile_allowed, profile_analysis
+from responses import CONTENT_KEY, etag_matches, lookup_available, negotiate_body, result_etag, result_location
+from schema import parse_schema, render_result
+
+logger = logging.getLogger(__name__)
+
+# Analyzer riêng của mỗi worker process, được khởi tạo một lần trong init_worker
+_worker_analyzer = None
+
+
+def init_worker():
+    """Khởi tạo và warm-up TextAnalyzer một lần cho mỗi worker process"""
+    global _worker_analyzer
+    setup_logging()
+    _worker_analyzer = TextAnalyzer()
+    _worker_analyzer.warm_up()
+
+
+def analyze_in_worker(text: str, use_nltk: Optional[bool] = None, deadline: Optional[Deadline] = None,
+                      profile_mode: Optional[str] = None, layers=None,
+                      schema: str = 'v1') -> Tuple[Optional[Dict], str]:
+    """
+    Phân tích một văn bản trong worker process (deadline tính cả thời gian chờ trong hàng đợi).
+    Trả về (kết quả, khóa nội dung cho ETag)
+    """
+    if profile_mode is not None:
+        result = profile_analysis(_worker_analyzer, text, profile_mode, use_nltk, deadline, layers)
+    else:
+        result = _worker_analyzer.analyze_text(text, use_nltk, deadline, layers=layers)
+    # Chuyển schema trong worker: kết quả v2 gửi về event loop nhỏ hơn
+    return render_result(result, schema), _worker_analyzer.cache_key(text, use_nltk)
+
+
+def lookup_in_worker(text_hash: str, layers=None, schema: str = 'v1') -> Optional[Dict]:
+    """Kết quả đã có trong cache theo khóa nội dung (None nếu không còn)"""
+    result, _ = _worker_analyzer.cached_layers(text_hash, layers)
+    return render_result(result, schema)
+
+
+def worker_readiness() -> Dict:
+    """Trạng thái warm-up của worker process, kèm pid để phân biệt các worker"""
+    return {'pid': os.getpid(), **_worker_analyzer.readiness()}
+
+
+class PoolFullError(Exception):
+    """Mọi worker đều bận và hàng đợi đã đầy"""
+
+
+class AnalysisPool:
+    """
+    Pool process phân tích với backpressure: tối đa `workers` việc chạy cùng lúc và `queue_depth` request chờ.
+    Request chờ bị hủy (client ngắt kết nối) rời hàng đợi ngay; việc đang chạy không thể dừng giữa chừng,
+    slot được trả lại khi worker chạy xong và kết quả bị bỏ đi.
+    """
+
+    def __init__(self, workers: int, queue_depth: int, on_restart: Optional[Callable[[], None]] = None):
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        # Gọi (trên event loop) sau khi executor được tạo lại, ví dụ để warm-up lại các worker mới
+        self.on_restart = on_restart
+        self.executor = self._create_executor()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._loop = None
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: không fork tiến trình đang có event loop và các thread của server
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker
+        )
+
+    def _release(self):
+        self.running -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args):
+        """Chạy fn(*args) trong pool, raise PoolFullError nếu không còn chỗ trong hàng đợi"""
+        if self._slots.locked() and self.waiting >= self.queue_depth:
+            self.rejected += 1
+            raise PoolFullError()
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        self._loop = asyncio.get_running_loop()
+        self.running += 1
+        try:
+            future = self.executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._release()
+            self.restart()
+            raise
+        except BaseException:
+            self._release()
+            raise
+        # Callback chạy trong thread quản lý của executor: trả slot trên event loop
+        future.add_done_callback(lambda _: self._loop.call_soon_threadsafe(self._release))
+
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except BrokenProcessPool:
+            self.restart()
+            raise
+
+    def restart(self):
+        """Tạo lại executor khi một worker chết bất thường (các việc đang chạy đã thất bại)"""
+        logger.error("Worker process chết bất thường, khởi tạo lại pool")
+        old_executor = self.executor
+        self.executor = self._create_executor()
+        old_executor.shutdown(wait=False, cancel_futures=True)
+        if self.on_restart is not None:
+            self.on_restart()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'running': self.running,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled
+        }
+
+
+def pool_metrics(pool: Optional[AnalysisPool]) -> List[Metric]:
+    """Metrics của pool process: số việc đang chạy, đang chờ và số request bị từ chối/hủy"""
+    if pool is None:
+        return []
+    stats = pool.stats()
+    workers = Gauge('nlp_pool_workers', 'Số worker process phân tích')
+    running = Gauge('nlp_pool_running', 'Số việc đang chạy trong pool')
+    waiting = Gauge('nlp_pool_queue_depth', 'Số request đang chờ slot trong pool')
+    rejected = Counter('nlp_pool_rejected_total', 'Số request bị từ chối vì hàng đợi đầy')
+    cancelled = Counter('nlp_pool_cancelled_total', 'Số request bị hủy do client ngắt kết nối')
+    workers.set(stats['workers'])
+    running.set(stats['running'])
+    waiting.set(stats['waiting'])
+    rejected.inc(stats['rejected'])
+    cancelled.inc(stats['cancelled'])
+    return [workers, running, waiting, rejected, cancelled]
+
+
+async def read_body(receive, max_bytes: int) -> Optional[bytes]:
+    """Đọc toàn bộ body của request, None nếu vượt quá max_bytes"""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise asyncio.CancelledError()
+        body.extend(message.get('body', b''))
+        if len(body) > max_bytes:
+            return None
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def wait_for_disconnect(receive):
+    """Chờ đến khi client ngắt kết nối (sau khi đã đọc hết body)"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def send_json(send, payload: Dict, status: int = 200, headers: Tuple = (),
+                    accept_encoding: Optional[str] = None):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    extra = []
+    if status == 200 and accept_encoding is not None:
+        # Nén theo Accept-Encoding của client (chỉ response thành công đủ lớn)
+        body, encoding = negotiate_body(body, accept_encoding)
+        if encoding is not None:
+            extra.append((b'content-encoding', encoding.encode('latin-1')))
+        if encoding is not None or len(body) >= config.COMPRESS_MIN_BYTES:
+            extra.append((b'vary', b'Accept-Encoding'))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            *extra,
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncApp:
+    """Ứng dụng ASGI: /analyze qua pool process, cùng các endpoint liveness/readiness"""
+
+    ENDPOINTS = ('/analyze', '/metrics', '/health/live', '/health/ready')
+
+    def __init__(self, workers: int = None, queue_depth: int = None):
+        self.workers = workers or config.POOL_WORKERS
+        self.queue_depth = config.POOL_QUEUE_DEPTH if queue_depth is None else queue_depth
+        self.pool: Optional[AnalysisPool] = None
+        # Trạng thái readiness của từng worker sau warm-up (None: đang warm-up)
+        self.worker_states: Optional[List[Dict]] = None
+        self._warm_task = None
+        # Metrics trong front end: request, payload và hàng đợi của pool
+        # (thời gian từng bước được đo trong các worker process, không có ở đây)
+        REGISTRY.add_collector(lambda: pool_metrics(self.pool))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.pool = AnalysisPool(self.workers, self.queue_depth, on_restart=self.schedule_warm_up)
+                self.schedule_warm_up()
+                logger.info(f"Analysis pool: {self.workers} workers, hàng đợi {self.queue_depth}")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._warm_task is not None:
+                    self._warm_task.cancel()
+                if self.pool is not None:
+                    self.pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def schedule_warm_up(self):
+        """Warm-up (lại) các worker: readiness trở về chưa sẵn sàng cho đến khi warm-up xong"""
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+        self.worker_states = None
+        self._warm_task = asyncio.ensure_future(self.warm_up())
+
+    async def warm_up(self):
+        """
+        Khởi động tất cả worker process (mỗi worker tự warm-up trong init_worker) và lấy readiness của từng worker.
+        Các lần hỏi dùng chung một hàng đợi nên một worker có thể nhận nhiều lần: hỏi lại cho đến khi
+        mọi worker (phân biệt theo pid) đã trả lời, tối đa POOL_READY_TIMEOUT giây
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.pool.executor
+        states: Dict[int, Dict] = {}
+        give_up_at = time.monotonic() + config.POOL_READY_TIMEOUT
+        while True:
+            # Gửi đủ N lần hỏi cùng lúc: executor tạo đủ N process khi chưa có worker rảnh
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, worker_readiness) for _ in range(self.workers)
+            ], return_exceptions=True)
+            if executor is not self.pool.executor:
+                # Pool đã được tạo lại trong lúc warm-up: kết quả thuộc các worker cũ
+                return
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                # Executor hỏng (ví dụ init_worker lỗi): không worker nào phục vụ được
+                self.worker_states = [{'ready': False, 'warmup': 'error', 'engines': {}, 'error': str(errors[0])}]
+                logger.error(f"Warm-up worker process thất bại: {errors[0]}")
+                return
+            for result in results:
+                states[result['pid']] = result
+            self.worker_states = list(states.values())
+            if len(states) >= self.workers:
+                break
+            if time.monotonic() >= give_up_at:
+                logger.error(f"Chỉ {len(states)}/{self.workers} worker process trả lời readiness "
+                             f"sau {config.POOL_READY_TIMEOUT:.0f}s")
+                return
+            await asyncio.sleep(0.5)
+
+        if self.ready:
+            logger.info("Các worker process đã sẵn sàng")
+        else:
+            logger.error("Có worker process không warm-up được các engines bắt buộc")
+
+    @property
+    def ready(self) -> bool:
+        """Sẵn sàng khi mọi worker (theo pid) đã warm-up xong và báo ready"""
+        return (self.worker_states is not None and len(self.worker_states) >= self.workers
+                and all(state['ready'] for state in self.worker_states))
+
+    async def handle_http(self, scope, receive, send):
+        """Đo request (status, thời gian, số request đang xử lý) rồi chuyển cho route tương ứng"""
+        if scope['path'] in self.ENDPOINTS:
+            endpoint = scope['path']
+        elif self.lookup_key(scope['path']) is not None:
+            endpoint = '/analyze/<text_hash>'
+        else:
+            endpoint = 'other'
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            await self.route(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec()
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=status)
+
+    @staticmethod
+    def lookup_key(path: str) -> Optional[str]:
+        """Khóa nội dung trong đường dẫn /analyze/<khóa>, None nếu không phải route này"""
+        prefix, _, key = path.rpartition('/')
+        return key if prefix == '/analyze' and CONTENT_KEY.match(key) else None
+
+    async def route(self, scope, receive, send):
+        method, path = scope['method'], scope['path']
+        if path == '/analyze' and method == 'POST':
+            await self.analyze(scope, receive, send)
+        elif self.lookup_key(path) is not None and method == 'GET':
+            await self.lookup(scope, send, self.lookup_key(path))
+        elif path == '/metrics' and method == 'GET':
+            body = REGISTRY.render().encode('utf-8')
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', CONTENT_TYPE.encode('latin-1')),
+                            (b'content-length', str(len(body)).encode('latin-1'))]
+            })
+            await send({'type': 'http.response.body', 'body': body})
+        elif path == '/health/live' and method == 'GET':
+            await send_json(send, {'status': 'alive'})
+        elif path == '/health/ready' and method == 'GET':
+            ready = self.ready
+            await send_json(send, {
+                'ready': ready,
+                'engines': self.worker_states[0]['engines'] if self.worker_states else {},
+                'workers': self.worker_states or [],
+                'pool': self.pool.stats() if self.pool else None
+            }, 200 if ready else 503)
+        else:
+            await send_json(send, {'error': 'Không tìm thấy endpoint'}, 404)
+
+    async def analyze(self, scope, receive, send):
+        """API endpoint để phân tích văn bản, cùng định dạng request/response với app.py"""
+        started = time.perf_counter()
+        headers = dict(scope.get('headers') or [])
+        if not headers.get(b'content-type', b'').split(b';')[0].strip() == b'application/json':
+            await send_json(send, {'error': 'Request phải là JSON'}, 400)
+            return
+
+        try:
+            body = await read_body(receive, config.POOL_MAX_BODY_BYTES)
+        except asyncio.CancelledError:
+            return
+        REQUEST_BYTES.observe(len(body) if body is not None else config.POOL_MAX_BODY_BYTES, endpoint='/analyze')
+        if body is None:
+            await send_json(send, {'error': f'Request quá lớn (tối đa {config.POOL_MAX_BODY_BYTES} bytes)'}, 413)
+            return
+
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not data:
+            await send_json(send, {'error': 'Dữ liệu JSON không hợp lệ'}, 400)
+            return
+
+        text = data.get('text', '')
+        text = text.strip() if isinstance(text, str) else text
+        use_nltk = data.get('nltk')
+        if use_nltk is not None and not isinstance(use_nltk, bool):
+            await send_json(send, {'error': 'nltk phải là true hoặc false'}, 400)
+            return
+        try:
+            deadline = parse_deadline_ms(data.get('deadline_ms'))
+            profile_mode = parse_profile_mode(data.get('profile'))
+            layers = parse_layers(data.get('layers', data.get('fields')))
+            schema = parse_schema(data.get('schema'))
+        except ValueError as e:
+            await send_json(send, {'error': str(e)}, 400)
+            return
+        if profile_mode is not None and not profile_allowed(headers.get(b'x-profile-token', b'').decode('latin-1')):
+            await send_json(send, {'error': 'Profiling không được bật hoặc token không hợp lệ'}, 403)
+            return
+
+        # Validate trước khi chiếm slot trong pool
+        is_valid, error_msg = TextAnalyzer.validate_input(text)
+        if not is_valid:
+            log_request('/analyze', 400, started, text, error=error_msg)
+            await send_json(send, {'error': error_msg}, 400)
+            return
+
+        analysis = asyncio.ensure_future(self.pool.run(analyze_in_worker, text, use_nltk, deadline, profile_mode, layers, schema))
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        done, _ = await asyncio.wait({analysis, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if analysis not in done:
+            # Client đã ngắt kết nối: rời hàng đợi (hoặc bỏ kết quả nếu worker đang chạy)
+            analysis.cancel()
+            logger.info("Client ngắt kết nối, hủy request phân tích")
+            return
+        disconnect.cancel()
+
+        try:
+            result, text_hash = analysis.result()
+        except PoolFullError:
+            log_request('/analyze', 503, started, text, error='pool full')
+            await send_json(send, {'error': 'Máy chủ đang quá tải, vui lòng thử lại sau'}, 503,
+                            headers=((b'retry-after', str(config.POOL_RETRY_AFTER).encode('latin-1')),))
+            return
+        except Exception as e:
+            logger.error(f"Error in analyze: {str(e)}")
+            log_request('/analyze', 500, started, text, error=str(e))
+            await send_json(send, {'error': f'Lỗi khi phân tích: {str(e)}'}, 500)
+            return
+
+        if result is None:
+            log_request('/analyze', 500, started, text, error='Không thể phân tích văn bản')
+            await send_json(send, {'error': 'Không thể phân tích văn bản'}, 500)
+            return
+        log_request('/analyze', 200, started, text, result)
+        response_headers = ()
+        if profile_mode is None and not result.get('partial'):
+            # Kết quả đầy đủ: ETag theo nội dung và địa chỉ GET để tra lại (If-None-Match -> 304)
+            response_headers = ((b'etag', result_etag(text_hash, layers, schema).encode('latin-1')),)
+            if lookup_available(bool(config.CACHE_PERSISTENT_PATH), self.pool.workers):
+                # Mỗi worker của pool có cache riêng: chỉ trỏ tới GET khi cache dùng chung hoặc chỉ một worker
+                response_headers += (
+                    (b'content-location', result_location(text_hash, layers, schema).encode('latin-1')),
+                )
+        await send_json(send, {'success': True, 'result': result}, headers=response_headers,
+                        accept_encoding=headers.get(b'accept-encoding', b'').decode('latin-1'))
+
+    @staticmethod
+    async def send_not_modified(send, headers: Tuple):
+        await send({'type': 'http.response.start', 'status': 304, 'headers': list(headers)})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def lookup(self, scope, send, text_hash: str):
+        """
+        GET /analyze/<khóa>: kết quả đã phân tích theo khóa nội dung, cùng định dạng với app.py.
+        If-None-Match khớp ETag thì trả về 304 ngay trên event loop, không chiếm slot trong pool
+        ('*' chỉ khớp sau khi tra được kết quả trong cache)
+        """
+        headers = dict(scope.get('headers') or [])
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            layers = parse_layers((query.get('layers') or query.get('fields') or [None])[0])
+            schema = parse_schema((query.get('schema') or [None])[0])
+        except ValueError as e:
+            await send_json(send, {'error': str(e)}, 400)
+            return
+
+        etag = result_etag(text_hash, layers, schema)
+        cache_headers = ((b'etag', etag.encode('latin-1')), (b'cache-control', b'no-cache'))
+        if_none_match = headers.get(b'if-none-match', b'').decode('latin-1')
+        if etag_matches(if_none_match, etag):
+            await self.send_not_modified(send, cache_headers)
+            return
+
+        try:
+            result = await self.pool.run(lookup_in_worker, text_hash, layers, schema)
+        except PoolFullError:
+            await send_json(send, {'error': 'Máy chủ đang quá tải, vui lòng thử lại sau'}, 503,
+                            headers=((b'retry-after', str(config.POOL_RETRY_AFTER).encode('latin-1')),))
+            return
+        if result is None:
+            await send_json(send, {'error': 'Không có kết quả cho khóa này, gửi văn bản qua POST /analyze'}, 404)
+            return
+        if etag_matches(if_none_match, etag, exists=True):
+            await self.send_not_modified(send, cache_headers)
+            return
+        await send_json(send, {'success': True, 'result': result}, headers=cache_headers,
+                        accept_encoding=headers.get(b'accept-encoding', b'').decode('latin-1'))
+
+
+setup_logging()
+app = AsyncApp()
@@ -0,0 +1,346 @@
+"""
+Benchmark hiệu năng của TextAnalyzer trên các ví dụ trong test_examples.md
+- cold: process mới, lần phân tích đầu tiên (gồm cả nạp models) cho từng nhánh ngôn ngữ
+- warm: phân tích lặp lại (bỏ qua cache), p50/p95/p99, throughput; cached: thời gian khi trúng cache
+- scaling: corpus tổng hợp 100 -> 10.000 ký tự, thời gian tổng và theo bước để phát hiện tăng trưởng siêu tuyến tính
+- baseline: lưu kết quả và so sánh các lần chạy sau, báo regression khi chậm hơn ngưỡng
+
+Ví dụ:
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --baseline bench_baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+import config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_examples.md')
+LANGUAGE_PATHS = ('vietnamese', 'english', 'mixed')
+DEFAULT_LENGTHS = (100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Tiêu đề mục trong test_examples.md -> nhánh ngôn ngữ
+SECTION_PATHS = (('Tiếng Việt', 'vietnamese'), ('Tiếng Anh', 'english'), ('Hỗn hợp', 'mixed'))
+CODE_BLOCK = re.compile(r'```\n(.*?)\n```', re.DOTALL)
+
+# Độ dốc log-log của thời gian theo độ dài lớn hơn ngưỡng này được coi là siêu tuyến tính
+SUPERLINEAR_SLOPE = 1.2
+
+
+def load_examples(path: str = EXAMPLES_PATH) -> Dict[str, List[str]]:
+    """Đọc các văn bản mẫu (khối ```) theo mục tiếng Việt, tiếng Anh và hỗn hợp"""
+    with open(path, encoding='utf-8') as source:
+        content = source.read()
+    examples = {language_path: [] for language_path in LANGUAGE_PATHS}
+    for section in re.split(r'\n## ', content):
+        title = section.split('\n', 1)[0]
+        for keyword, language_path in SECTION_PATHS:
+            if keyword in title:
+                examples[language_path].extend(block.strip() for block in CODE_BLOCK.findall(section))
+    return examples
+
+
+def synthetic_text(samples: Sequence[str], length: int) -> str:
+    """Văn bản tổng hợp dài khoảng `length` ký tự bằng cách nối các câu mẫu (cắt ở ranh giới câu khi có thể)"""
+    sentences = [sentence for sample in samples for sentence in re.split(r'(?<=[.!?])\s+', sample) if sentence]
+    parts = []
+    size = 0
+    index = 0
+    while size < length:
+        sentence = sentences[index % len(sentences)]
+        parts.append(sentence)
+        size += len(sentence) + 1
+        index += 1
+    text = ' '.join(parts)
+    if len(text) > length:
+        cut = text.rfind(' ', 0, length)
+        text = text[:cut if cut > length // 2 else length]
+    return text
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Percentile theo nearest-rank"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Bộ nhớ RSS cao nhất của process hiện tại (MB), None nếu không đo được"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def latency_summary(durations: List[float], wall_seconds: float) -> Dict:
+    return {
+        'runs': len(durations),
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3),
+        'throughput_per_s': round(len(durations) / wall_seconds, 2) if wall_seconds > 0 else None
+    }
+
+
+def cold_start(texts: List[str]) -> Dict:
+    """Chạy trong process mới: thời gian import, khởi tạo và lần phân tích đầu tiên"""
+    logging.disable(logging.CRITICAL)
+    started = time.perf_counter()
+    from analyzer import TextAnalyzer
+    imported = time.perf_counter()
+    analyzer = TextAnalyzer()
+    first_started = time.perf_counter()
+    result = analyzer.analyze_text(texts[0], use_cache=False)
+    finished = time.perf_counter()
+    return {
+        'import_ms': round((imported - started) * 1000, 1),
+        'first_analysis_ms': round((finished - first_started) * 1000, 1),
+        'total_ms': round((finished - started) * 1000, 1),
+        'success': result is not None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def run_cold(examples: Dict[str, List[str]], paths: Sequence[str]) -> Dict:
+    """Cold start cho từng nhánh, mỗi nhánh một process mới (spawn) để không dùng lại models đã nạp"""
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for language_path in paths:
+        if not examples.get(language_path):
+            continue
+        with context.Pool(1) as pool:
+            results[language_path] = pool.apply(cold_start, (examples[language_path],))
+    return results
+
+
+def run_warm(analyzer, examples: Dict[str, List[str]], paths: Sequence[str], iterations: int) -> Dict:
+    """Phân tích lặp lại các văn bản mẫu của từng nhánh (bỏ qua cache), rồi đo thời gian khi trúng cache"""
+    results = {}
+    for language_path in paths:
+        texts = examples.get(language_path)
+        if not texts:
+            continue
+        # Lượt đầu để nạp models và lưu kết quả vào cache, chỉ đo các văn bản phân tích được
+        analyzed = [text for text in texts if analyzer.analyze_text(text) is not None]
+        failures = len(texts) - len(analyzed)
+        texts = analyzed
+        if not texts:
+            results[language_path] = {'error': 'Không phân tích được văn bản nào (thiếu model?)'}
+            continue
+
+        durations = []
+        wall_started = time.perf_counter()
+        for index in range(iterations):
+            text = texts[index % len(texts)]
+            started = time.perf_counter()
+            analyzer.analyze_text(text, use_cache=False)
+            durations.append(time.perf_counter() - started)
+        wall_seconds = time.perf_counter() - wall_started
+
+        cached = []
+        for index in range(iterations):
+            started = time.perf_counter()
+            analyzer.analyze_text(texts[index % len(texts)])
+            cached.append(time.perf_counter() - started)
+
+        results[language_path] = dict(latency_summary(durations, wall_seconds), failures=failures)
+        results[language_path]['cached_p50_ms'] = round(percentile(cached, 0.50) * 1000, 4)
+    return results
+
+
+def loglog_slope(points: List[tuple]) -> Optional[float]:
+    """Độ dốc hồi quy của log(thời gian) theo log(độ dài): ~1 là tuyến tính, ~2 là bậc hai"""
+    points = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in points) / variance, 3)
+
+
+def run_scaling(analyzer, examples: Dict[str, List[str]], paths: Sequence[str], lengths: Sequence[int],
+                repeats: int) -> Dict:
+    """Thời gian phân tích (median) và theo bước cho văn bản tổng hợp ở từng độ dài"""
+    from profiling import profiled
+
+    results = {}
+    for language_path in paths:
+        samples = examples.get(language_path)
+        if not samples:
+            continue
+        rows = []
+        for length in lengths:
+            if length > config.MAX_TEXT_CHARS:
+                continue
+            text = synthetic_text(samples, length)
+            durations = []
+            stages: Dict[str, float] = {}
+            failed = False
+            for _ in range(repeats):
+                with profiled('timing') as report:
+                    started = time.perf_counter()
+                    failed = analyzer.analyze_text(text, use_cache=False) is None
+                    durations.append(time.perf_counter() - started)
+                for stage in report['stages']:
+                    stages.setdefault(stage['name'], []).append(stage['total_ms'])
+            if failed:
+                continue
+            rows.append({
+                'length': length,
+                'chars': len(text),
+                'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+                'stages_ms': {name: round(percentile(values, 0.50), 3) for name, values in sorted(stages.items())}
+            })
+
+        stage_names = sorted({name for row in rows for name in row['stages_ms']})
+        slopes = {'total': loglog_slope([(row['chars'], row['p50_ms']) for row in rows])}
+        for name in stage_names:
+            slopes[name] = loglog_slope([(row['chars'], row['stages_ms'].get(name, 0)) for row in rows])
+        results[language_path] = {
+            'lengths': rows,
+            'slopes': slopes,
+            'superlinear': sorted(name for name, slope in slopes.items() if slope and slope > SUPERLINEAR_SLOPE)
+        }
+    return results
+
+
+def flatten_metrics(report: Dict) -> Dict[str, float]:
+    """Các chỉ số thời gian (ms) dùng để so sánh với baseline"""
+    metrics = {}
+    for language_path, summary in report.get('warm', {}).items():
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if key in summary:
+                metrics[f'warm.{language_path}.{key}'] = summary[key]
+    for language_path, scaling in report.get('scaling', {}).items():
+        for row in scaling['lengths']:
+            metrics[f'scaling.{language_path}.{row["length"]}.p50_ms'] = row['p50_ms']
+    for language_path, cold in report.get('cold', {}).items():
+        metrics[f'cold.{language_path}.total_ms'] = cold['total_ms']
+    return metrics
+
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """So sánh với baseline: regression khi chậm hơn baseline quá threshold (0.2 = 20%)"""
+    current = flatten_metrics(report)
+    previous = flatten_metrics(baseline)
+    rows = []
+    for name in sorted(set(current) & set(previous)):
+        if previous[name] <= 0:
+            continue
+        change = current[name] / previous[name] - 1
+        rows.append({
+            'metric': name,
+            'baseline': previous[name],
+            'current': current[name],
+            'change': round(change, 3),
+            'regression': change > threshold
+        })
+    return rows
+
+
+def print_report(report: Dict, comparison: Optional[List[Dict]]):
+    for language_path, cold in report.get('cold', {}).items():
+        print(f"cold    {language_path:<10} import {cold['import_ms']:>8.1f} ms  first analysis {cold['first_analysis_ms']:>8.1f} ms"
+              f"  rss {cold['peak_rss_mb']} MB")
+    for language_path, summary in report.get('warm', {}).items():
+        if 'error' in summary:
+            print(f"warm    {language_path:<10} {summary['error']}")
+            continue
+        print(f"warm    {language_path:<10} p50 {summary['p50_ms']:>8.2f} ms  p95 {summary['p95_ms']:>8.2f} ms"
+              f"  p99 {summary['p99_ms']:>8.2f} ms  {summary['throughput_per_s']:>8.1f} văn bản/s"
+              f"  (cache hit p50 {summary['cached_p50_ms']} ms)")
+    for language_path, scaling in report.get('scaling', {}).items():
+        for row in scaling['lengths']:
+            print(f"scaling {language_path:<10} {row['chars']:>6} ký tự  p50 {row['p50_ms']:>9.2f} ms  "
+                  + ' '.join(f"{name}={value}" for name, value in row['stages_ms'].items()))
+        print(f"scaling {language_path:<10} độ dốc log-log: {scaling['slopes']}"
+              + (f"  SIÊU TUYẾN TÍNH: {', '.join(scaling['superlinear'])}" if scaling['superlinear'] else ''))
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+
+    if comparison is not None:
+        regressions = [row for row in comparison if row['regression']]
+        for row in comparison:
+            marker = 'REGRESSION' if row['regression'] else ''
+            print(f"{row['metric']:<40} {row['baseline']:>10} -> {row['current']:>10} ({row['change']:+.1%}) {marker}")
+        print(f"{len(regressions)} regression / {len(comparison)} chỉ số")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark độ trễ và throughput của TextAnalyzer')
+    parser.add_argument('--examples', default=EXAMPLES_PATH, help='File ví dụ (mặc định: test_examples.md)')
+    parser.add_argument('--paths', default=','.join(LANGUAGE_PATHS), help='Các nhánh ngôn ngữ, phân tách bằng dấu phẩy')
+    parser.add_argument('--iterations', type=int, default=50, help='Số lần phân tích warm cho mỗi nhánh')
+    parser.add_argument('--lengths', default=','.join(map(str, DEFAULT_LENGTHS)), help='Độ dài corpus tổng hợp (ký tự)')
+    parser.add_argument('--repeats', type=int, default=5, help='Số lần đo cho mỗi độ dài')
+    parser.add_argument('--no-cold', action='store_true', help='Bỏ qua đo cold start (mỗi nhánh một process mới)')
+    parser.add_argument('--no-scaling', action='store_true', help='Bỏ qua corpus tổng hợp')
+    parser.add_argument('-o', '--output', help='Ghi kết quả đầy đủ ra file JSON')
+    parser.add_argument('--baseline', help='File baseline để so sánh')
+    parser.add_argument('--save-baseline', help='Lưu kết quả làm baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Ngưỡng regression (0.2 = chậm hơn 20%%)')
+    args = parser.parse_args(argv)
+
+    if args.iterations < 1 or args.repeats < 1:
+        parser.error('--iterations và --repeats phải lớn hơn 0')
+    paths = [name.strip() for name in args.paths.split(',') if name.strip()]
+    unknown = set(paths) - set(LANGUAGE_PATHS)
+    if unknown:
+        parser.error(f"Nhánh không hợp lệ: {', '.join(sorted(unknown))}")
+    try:
+        lengths = [int(value) for value in args.lengths.split(',') if value.strip()]
+    except ValueError:
+        parser.error('--lengths phải là danh sách số nguyên')
+
+    logging.basicConfig(level=logging.WARNING)
+    examples = load_examples(args.examples)
+    report: Dict = {
+        'python': sys.version.split()[0],
+        'iterations': args.iterations,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    if not args.no_cold:
+        report['cold'] = run_cold(examples, paths)
+
+    from analyzer import TextAnalyzer
+    analyzer = TextAnalyzer()
+    report['warm'] = run_warm(analyzer, examples, paths, args.iterations)
+    if not args.no_scaling:
+        report['scaling'] = run_scaling(analyzer, examples, paths, lengths, args.repeats)
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as source:
+            comparison = compare(report, json.load(source), args.threshold)
+        report['comparison'] = comparison
+
+    print_report(report, comparison)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+
+    if comparison and any(row['regression'] for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,522 @@
+"""
+Cache cho kết quả phân tích văn bản
+LRU có giới hạn số entries và dung lượng (bytes), hỗ trợ TTL và nén kết quả
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+def make_cache_key(text: str, *parts: str) -> str:
+    """
+    Tạo khóa cache ổn định (SHA-256) từ đúng văn bản được phân tích: không strip,
+    vì offset của token/entity phụ thuộc cả khoảng trắng ở đầu văn bản
+    """
+    digest = hashlib.sha256()
+    digest.update(text.encode('utf-8'))
+    for part in parts:
+        # Ký tự phân cách để ("ab", "c") khác ("a", "bc")
+        digest.update(b'\x00')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def encode_result(result: Dict, compress: bool = False) -> bytes:
+    """Chuyển kết quả phân tích thành bytes để lưu cache"""
+    payload = json.dumps(result, ensure_ascii=False, default=str).encode('utf-8')
+    if compress:
+        payload = zlib.compress(payload)
+    return payload
+
+
+def decode_result(payload: bytes, compressed: bool = False) -> Dict:
+    """Khôi phục kết quả phân tích từ bytes trong cache"""
+    if compressed:
+        payload = zlib.decompress(payload)
+    return json.loads(payload.decode('utf-8'))
+
+
+class AnalysisCache:
+    """Cache LRU cho kết quả phân tích, giới hạn theo số entries, bytes và TTL"""
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = 3600.0, compress: bool = False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.compress = compress
+
+        # key -> (payload, expires_at, compressed)
+        self._entries: 'OrderedDict[str, Tuple[bytes, Optional[float], bool]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict]:
+        """Lấy kết quả từ cache, trả về None nếu không có hoặc đã hết hạn"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+
+            payload, expires_at, compressed = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                if count:
+                    self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+
+        return decode_result(payload, compressed)
+
+    def record_lookup(self, hit: bool):
+        """Tính một lượt tra được quyết định bên ngoài get() (các lần get(count=False) của lượt đó)"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: str, result: Dict, ttl: Optional[float] = None) -> bool:
+        """Lưu kết quả vào cache, trả về False nếu kết quả lớn hơn giới hạn bytes"""
+        payload = encode_result(result, self.compress)
+        if self.max_bytes and len(payload) > self.max_bytes:
+            return False
+
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, expires_at, self.compress)
+            self._bytes += len(payload)
+            self._evict()
+        return True
+
+    def delete(self, key: str) -> bool:
+        """Xóa một entry khỏi cache"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> int:
+        """Xóa toàn bộ cache, trả về số entries đã xóa"""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            return count
+
+    def stats(self) -> Dict:
+        """Thống kê cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'compress': self.compress,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def _remove(self, key: str):
+        """Xóa entry (gọi khi đang giữ lock)"""
+        payload, _, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def _evict(self):
+        """Loại bỏ các entries cũ nhất cho đến khi nằm trong giới hạn (gọi khi đang giữ lock)"""
+        while self._entries and (
+            (self.max_entries and len(self._entries) > self.max_entries) or
+            (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+
+class SQLiteCache:
+    """Cache bền vững trên đĩa (SQLite, WAL), dùng chung giữa các worker và qua các lần khởi động lại"""
+
+    # Tạo schema trong một transaction: số entries trong meta được khởi tạo cùng lúc với trigger đếm
+    _SCHEMA = """
+        BEGIN IMMEDIATE;
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            compressed INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            expires_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+        CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries(expires_at);
+        CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta (name, value) VALUES ('bytes', 0);
+        INSERT OR IGNORE INTO meta (name, value) VALUES ('entries', (SELECT COUNT(*) FROM entries));
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            UPDATE meta SET value = value + NEW.size WHERE name = 'bytes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            UPDATE meta SET value = value - OLD.size WHERE name = 'bytes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+            UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'bytes';
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_insert_count AFTER INSERT ON entries BEGIN
+            UPDATE meta SET value = value + 1 WHERE name = 'entries';
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete_count AFTER DELETE ON entries BEGIN
+            UPDATE meta SET value = value - 1 WHERE name = 'entries';
+        END;
+        COMMIT;
+    """
+
+    # Chỉ cập nhật thời điểm truy cập khi cũ hơn ngưỡng này, tránh biến mỗi lần đọc thành lần ghi
+    ACCESS_UPDATE_INTERVAL = 60.0
+    # Chu kỳ (giây) xóa các entries hết hạn khi ghi; get() vẫn bỏ qua entry hết hạn giữa hai lần xóa
+    EXPIRE_SWEEP_INTERVAL = 60.0
+
+    def __init__(self, path: str, version: Optional[str] = None, max_entries: int = 0,
+                 max_bytes: int = 512 * 1024 * 1024, ttl: Optional[float] = None,
+                 compress: bool = True, timeout: float = 5.0):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.compress = compress
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._next_sweep = 0.0
+
+        conn = self._connect()
+        with conn:
+            conn.executescript(self._SCHEMA)
+        self._purge_other_versions(conn)
+
+    def _purge_other_versions(self, conn) -> int:
+        """
+        Version stamp khác (rules/model thay đổi) => entries cũ không còn hợp lệ.
+        version=None dùng cho công cụ quản trị: không lọc theo version
+        """
+        if self.version is None:
+            return 0
+        with conn:
+            return conn.execute("DELETE FROM entries WHERE version != ?", (self.version,)).rowcount
+
+    def set_version(self, version: str) -> int:
+        """Đổi version stamp (ví dụ sau khi nạp lại rules) và xóa các entries của version khác"""
+        if version == self.version:
+            return 0
+        self.version = version
+        return self._purge_other_versions(self._connect())
+
+    def _connect(self) -> 'sqlite3.Connection':
+        """Kết nối SQLite riêng cho mỗi thread và mỗi process (an toàn sau fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self) -> int:
+        return self._meta_value(self._connect(), 'entries')
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict]:
+        """Lấy kết quả từ cache trên đĩa"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT payload, compressed, accessed_at, expires_at FROM entries WHERE key = ? AND version = ?",
+            (key, self.version or '')
+        ).fetchone()
+        if row is None:
+            if count:
+                self._count('misses')
+            return None
+
+        payload, compressed, accessed_at, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count('expirations')
+            if count:
+                self._count('misses')
+            return None
+
+        if now - accessed_at > self.ACCESS_UPDATE_INTERVAL:
+            with conn:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        if count:
+            self._count('hits')
+        return decode_result(payload, bool(compressed))
+
+    def record_lookup(self, hit: bool):
+        """Tính một lượt tra được quyết định bên ngoài get() (các lần get(count=False) của lượt đó)"""
+        self._count('hits' if hit else 'misses')
+
+    def set(self, key: str, result: Dict, ttl: Optional[float] = None) -> bool:
+        """Lưu kết quả vào cache trên đĩa"""
+        payload = encode_result(result, self.compress)
+        if self.max_bytes and len(payload) > self.max_bytes:
+            return False
+
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = now + ttl if ttl else None
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """INSERT INTO entries (key, version, payload, compressed, size, created_at, accessed_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET
+                       version = excluded.version, payload = excluded.payload,
+                       compressed = excluded.compressed, size = excluded.size,
+                       created_at = excluded.created_at, accessed_at = excluded.accessed_at,
+                       expires_at = excluded.expires_at""",
+                (key, self.version or '', payload, int(self.compress), len(payload), now, now, expires_at)
+            )
+        self._evict(conn)
+        return True
+
+    def delete(self, key: str) -> bool:
+        """Xóa một entry khỏi cache trên đĩa"""
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount > 0
+
+    def clear(self) -> int:
+        """Xóa toàn bộ cache trên đĩa, trả về số entries đã xóa"""
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM entries").rowcount
+
+    @staticmethod
+    def _meta_value(conn, name: str) -> int:
+        """Bộ đếm trong bảng meta (được các trigger cập nhật khi thêm/xóa entries)"""
+        return conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()[0]
+
+    def _total_bytes(self, conn) -> int:
+        return self._meta_value(conn, 'bytes')
+
+    def _sweep_expired(self, conn):
+        """Xóa các entries hết hạn, tối đa một lần mỗi EXPIRE_SWEEP_INTERVAL giây trong mỗi process"""
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.EXPIRE_SWEEP_INTERVAL
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            ).rowcount
+        with self._stats_lock:
+            self.expirations += max(expired, 0)
+
+    def _evict(self, conn):
+        """Loại bỏ entries hết hạn (theo chu kỳ) và entries ít được truy cập nhất khi vượt giới hạn"""
+        self._sweep_expired(conn)
+
+        while True:
+            excess = 0
+            if self.max_entries:
+                excess = max(self._meta_value(conn, 'entries') - self.max_entries, 0)
+            if self.max_bytes and self._total_bytes(conn) > self.max_bytes:
+                # Xóa theo lô nhỏ cho đến khi nằm trong giới hạn bytes
+                excess = max(excess, 16)
+            if not excess:
+                return
+
+            with conn:
+                removed = conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                ).rowcount
+            with self._stats_lock:
+                self.evictions += max(removed, 0)
+            if removed <= 0:
+                return
+
+    def export_snapshot(self, dest_path: str) -> int:
+        """Xuất snapshot nhất quán của cache ra file SQLite khác, trả về số entries"""
+        dest = sqlite3.connect(dest_path)
+        try:
+            self._connect().backup(dest)
+            return dest.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        finally:
+            dest.close()
+
+    def import_snapshot(self, src_path: str) -> int:
+        """Nạp entries từ snapshot (bỏ qua entries có version stamp khác), trả về số entries đã nạp"""
+        conn = self._connect()
+        conn.execute("ATTACH DATABASE ? AS snapshot", (src_path,))
+        try:
+            with conn:
+                imported = conn.execute(
+                    """INSERT INTO entries (key, version, payload, compressed, size, created_at, accessed_at, expires_at)
+                       SELECT key, version, payload, compressed, size, created_at, accessed_at, expires_at
+                       FROM snapshot.entries
+                       WHERE (? IS NULL OR version = ?) AND (expires_at IS NULL OR expires_at > ?)
+                       ON CONFLICT(key) DO NOTHING""",
+                    (self.version, self.version, time.time())
+                ).rowcount
+        finally:
+            conn.execute("DETACH DATABASE snapshot")
+        self._evict(conn)
+        return imported
+
+    def stats(self) -> Dict:
+        """Thống kê cache trên đĩa (hits/misses tính theo process hiện tại)"""
+        conn = self._connect()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            counters = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+        counters.update({
+            'backend': 'sqlite',
+            'path': self.path,
+            'version': self.version,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'bytes': self._total_bytes(conn),
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+            'compress': self.compress
+        })
+        return counters
+
+
+class TieredCache:
+    """Cache hai tầng: bộ nhớ (nhanh, riêng mỗi worker) phía trước cache trên đĩa (dùng chung)"""
+
+    def __init__(self, memory: AnalysisCache, persistent: SQLiteCache):
+        self.memory = memory
+        self.persistent = persistent
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict]:
+        result = self.memory.get(key, count=count)
+        if result is not None:
+            return result
+
+        result = self.persistent.get(key, count=count)
+        if result is not None:
+            # Đưa lên tầng bộ nhớ cho các lần đọc sau
+            self.memory.set(key, result)
+        return result
+
+    def record_lookup(self, hit: bool):
+        """
+        Tính một lượt tra được quyết định bên ngoài get(): hit được tính ở tầng bộ nhớ (kết quả từ đĩa
+        đã được đưa lên bộ nhớ), miss được tính ở cả hai tầng như get()
+        """
+        self.memory.record_lookup(hit)
+        if not hit:
+            self.persistent.record_lookup(False)
+
+    def set(self, key: str, result: Dict, ttl: Optional[float] = None) -> bool:
+        stored = self.memory.set(key, result, ttl)
+        return self.persistent.set(key, result, ttl) or stored
+
+    def delete(self, key: str) -> bool:
+        deleted = self.memory.delete(key)
+        return self.persistent.delete(key) or deleted
+
+    def clear(self) -> int:
+        """Xóa cả hai tầng, trả về số entries đã xóa trên đĩa (hoặc bộ nhớ nếu nhiều hơn)"""
+        memory_count = self.memory.clear()
+        persistent_count = self.persistent.clear()
+        return max(memory_count, persistent_count)
+
+    def stats(self) -> Dict:
+        stats = self.memory.stats()
+        stats['persistent'] = self.persistent.stats()
+        return stats
+
+
+def main():
+    """Quản lý cache trên đĩa từ dòng lệnh: stats, clear, export, import"""
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Quản lý cache phân tích trên đĩa')
+    parser.add_argument('command', choices=['stats', 'clear', 'export', 'import'])
+    parser.add_argument('snapshot', nargs='?', help='Đường dẫn file snapshot (cho export/import)')
+    parser.add_argument('--path', default=config.CACHE_PERSISTENT_PATH, help='File SQLite của cache')
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.error('Cần --path hoặc biến môi trường NLP_CACHE_PATH')
+    if args.command in ('export', 'import') and not args.snapshot:
+        parser.error(f'Lệnh {args.command} cần đường dẫn snapshot')
+
+    # Không truyền version: công cụ quản trị không được xóa entries của version khác
+    cache = SQLiteCache(args.path, max_bytes=config.CACHE_PERSISTENT_MAX_BYTES)
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    elif args.command == 'clear':
+        print(f'Đã xóa {cache.clear()} entries')
+    elif args.command == 'export':
+        print(f'Đã xuất {cache.export_snapshot(args.snapshot)} entries ra {args.snapshot}')
+    else:
+        print(f'Đã nạp {cache.import_snapshot(args.snapshot)} entries từ {args.snapshot}')
+
+
+if __name__ == '__main__':
+    main()
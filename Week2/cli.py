@@ -0,0 +1,238 @@
+"""
+Công cụ dòng lệnh phân tích corpus lớn bằng nhiều process
+Mỗi worker chỉ tải models một lần, hỗ trợ checkpoint để chạy tiếp khi bị dừng giữa chừng
+
+Ví dụ:
+    python cli.py corpus.jsonl -o results.jsonl --workers 4
+    python cli.py corpus.txt --text -o results_parquet --format parquet
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import config
+from streams import analyze_chunk, read_stream_items
+
+logger = logging.getLogger(__name__)
+
+# Analyzer riêng của mỗi worker, được khởi tạo một lần trong init_worker
+_worker_analyzer = None
+_worker_use_nltk = None
+
+
+def init_worker(use_nltk=None):
+    """Khởi tạo TextAnalyzer (tải models) một lần cho mỗi worker"""
+    global _worker_analyzer, _worker_use_nltk
+    from analyzer import TextAnalyzer
+    _worker_analyzer = TextAnalyzer()
+    _worker_use_nltk = use_nltk
+
+
+def process_chunk(task: Tuple[int, List[Tuple]]) -> Tuple[int, List[Dict]]:
+    """Phân tích một nhóm dòng trong worker, trả về (chỉ số nhóm, các dòng kết quả)"""
+    chunk_index, chunk = task
+    if _worker_analyzer is None:
+        init_worker()
+
+    return chunk_index, analyze_chunk(_worker_analyzer, chunk, _worker_use_nltk)
+
+
+def iter_chunks(path: str, is_ndjson: bool, chunk_size: int, skip_chunks: int = 0) -> Iterator[Tuple[int, List[Tuple]]]:
+    """Chia file đầu vào thành các nhóm dòng, bỏ qua các nhóm đã xử lý (khi resume)"""
+    with open(path, 'rb') as stream:
+        chunk = []
+        chunk_index = 0
+        for item in read_stream_items(stream, is_ndjson, config.STREAM_MAX_LINE_BYTES):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                if chunk_index >= skip_chunks:
+                    yield chunk_index, chunk
+                chunk_index += 1
+                chunk = []
+        if chunk and chunk_index >= skip_chunks:
+            yield chunk_index, chunk
+
+
+class JsonlWriter:
+    """Ghi kết quả dạng JSONL, mỗi dòng một kết quả"""
+
+    def __init__(self, path: str, resume_offset: int = 0):
+        self.path = path
+        self.file = open(path, 'ab' if resume_offset else 'wb')
+        if resume_offset:
+            # Bỏ phần ghi dở sau checkpoint cuối cùng
+            self.file.truncate(resume_offset)
+            self.file.seek(resume_offset)
+
+    def write_chunk(self, chunk_index: int, rows: List[Dict]) -> int:
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8'))
+            self.file.write(b'\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Ghi kết quả dạng cột (Parquet), mỗi nhóm dòng một file part trong thư mục đầu ra"""
+
+    def __init__(self, path: str, resume_offset: int = 0):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Định dạng parquet cần thư viện pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write_chunk(self, chunk_index: int, rows: List[Dict]) -> int:
+        columns = {
+            'line': [], 'id': [], 'success': [], 'error': [], 'language': [], 'detected_language': [],
+            'confidence_score': [], 'tokens': [], 'pos_tags': [], 'entity_texts': [], 'entity_labels': []
+        }
+        for row in rows:
+            result = row.get('result') or {}
+            token_layer = result.get('nltk_analysis') or {}
+            entity_layer = (result.get('spacy_analysis') or {}).get('entities', [])
+            columns['line'].append(row.get('line'))
+            columns['id'].append(None if row.get('id') is None else str(row['id']))
+            columns['success'].append(bool(row.get('success')))
+            columns['error'].append(row.get('error'))
+            columns['language'].append(result.get('language'))
+            columns['detected_language'].append(result.get('detected_language'))
+            columns['confidence_score'].append(result.get('confidence_score'))
+            columns['tokens'].append(list(token_layer.get('tokens', [])))
+            columns['pos_tags'].append([tag for _, tag in token_layer.get('pos_tags', [])])
+            columns['entity_texts'].append([entity['text'] for entity in entity_layer])
+            columns['entity_labels'].append([entity['label'] for entity in entity_layer])
+
+        part_path = os.path.join(self.path, f'part-{chunk_index:06d}.parquet')
+        tmp_path = part_path + '.tmp'
+        self.pq.write_table(self.pa.table(columns), tmp_path)
+        os.replace(tmp_path, part_path)
+        return 0
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'jsonl': JsonlWriter,
+    'parquet': ParquetWriter
+}
+
+
+def load_checkpoint(path: str, args) -> Optional[Dict]:
+    """Đọc checkpoint nếu khớp với tham số hiện tại"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    expected = {'input': os.path.abspath(args.input), 'chunk_size': args.chunk_size, 'format': args.format}
+    for key, value in expected.items():
+        if checkpoint.get(key) != value:
+            raise SystemExit(f"Checkpoint {path} không khớp tham số hiện tại ({key}), hãy xóa file này để chạy lại")
+    return checkpoint
+
+
+def save_checkpoint(path: str, args, completed_chunks: int, output_offset: int, processed: int):
+    """Ghi checkpoint một cách nguyên tử"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'input': os.path.abspath(args.input),
+            'chunk_size': args.chunk_size,
+            'format': args.format,
+            'completed_chunks': completed_chunks,
+            'output_offset': output_offset,
+            'processed': processed
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def run(args) -> int:
+    """Chạy phân tích corpus, trả về số dòng đã xử lý trong lần chạy này"""
+    checkpoint_path = args.checkpoint or f'{args.output}.checkpoint.json'
+    checkpoint = load_checkpoint(checkpoint_path, args) if args.resume else None
+    completed_chunks = checkpoint['completed_chunks'] if checkpoint else 0
+    output_offset = checkpoint['output_offset'] if checkpoint else 0
+    total_processed = checkpoint['processed'] if checkpoint else 0
+    if checkpoint:
+        logger.info(f"Resume từ checkpoint: {completed_chunks} nhóm, {total_processed} dòng đã xử lý")
+
+    is_ndjson = not args.text
+    chunks = iter_chunks(args.input, is_ndjson, args.chunk_size, skip_chunks=completed_chunks)
+    writer = WRITERS[args.format](args.output, resume_offset=output_offset)
+
+    if args.workers > 1:
+        pool = multiprocessing.Pool(processes=args.workers, initializer=init_worker, initargs=(args.nltk,))
+        # imap giữ đúng thứ tự nhóm, nên checkpoint luôn là một tiền tố liên tục của đầu vào
+        results = pool.imap(process_chunk, chunks)
+    else:
+        pool = None
+        init_worker(args.nltk)
+        results = map(process_chunk, chunks)
+
+    started = time.monotonic()
+    last_report = started
+    processed = 0
+    errors = 0
+    try:
+        for chunk_index, rows in results:
+            output_offset = writer.write_chunk(chunk_index, rows)
+            processed += len(rows)
+            errors += sum(1 for row in rows if not row.get('success'))
+            completed_chunks = chunk_index + 1
+            save_checkpoint(checkpoint_path, args, completed_chunks, output_offset, total_processed + processed)
+
+            now = time.monotonic()
+            if now - last_report >= args.progress_interval:
+                rate = processed / (now - started)
+                logger.info(f"Đã xử lý {total_processed + processed} dòng ({errors} lỗi), {rate:.1f} dòng/giây")
+                last_report = now
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.monotonic() - started
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Hoàn tất: {processed} dòng ({errors} lỗi) trong {elapsed:.1f}s, {rate:.1f} dòng/giây")
+    return processed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Phân tích corpus lớn bằng nhiều process')
+    parser.add_argument('input', help='File đầu vào: JSONL ({"id": ..., "text": ...}) hoặc text thuần với --text')
+    parser.add_argument('-o', '--output', required=True, help='File JSONL hoặc thư mục Parquet đầu ra')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl', help='Định dạng đầu ra')
+    parser.add_argument('--text', action='store_true', help='Mỗi dòng đầu vào là một văn bản thuần')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Số worker process')
+    parser.add_argument('--chunk-size', type=int, default=256, help='Số dòng mỗi nhóm gửi cho worker')
+    parser.add_argument('--checkpoint', help='File checkpoint (mặc định: <output>.checkpoint.json)')
+    parser.add_argument('--resume', action='store_true', help='Chạy tiếp từ checkpoint')
+    parser.add_argument('--nltk', action='store_true', default=None,
+                        help='Chạy NLTK riêng cho nltk_analysis thay vì lấy từ spaCy Doc')
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='Số giây giữa các lần báo tiến độ')
+    args = parser.parse_args(argv)
+
+    if args.chunk_size < 1:
+        parser.error('--chunk-size phải lớn hơn 0')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Cấu hình cho ứng dụng NLP
+Mọi giá trị đều có thể ghi đè bằng biến môi trường tương ứng
+"""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """Đọc biến môi trường kiểu int"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Đọc biến môi trường kiểu float"""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Đọc biến môi trường kiểu bool (1/true/yes/on)"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Cache kết quả phân tích trong bộ nhớ
+CACHE_MAX_ENTRIES = _env_int('NLP_CACHE_MAX_ENTRIES', 2048)
+CACHE_MAX_BYTES = _env_int('NLP_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+CACHE_TTL_SECONDS = _env_float('NLP_CACHE_TTL_SECONDS', 3600.0)
+CACHE_COMPRESS = _env_bool('NLP_CACHE_COMPRESS', False)
+
+# Cache phát hiện ngôn ngữ (theo đoạn mẫu của văn bản)
+LANGUAGE_CACHE_SIZE = _env_int('NLP_LANGUAGE_CACHE_SIZE', 4096)
+# Số ký tự đưa vào langdetect khi văn bản không rõ ràng (văn bản dài: lấy ở đầu, giữa và cuối)
+LANGUAGE_SAMPLE_CHARS = _env_int('NLP_LANGUAGE_SAMPLE_CHARS', 300)
+
+# Cache bền vững trên đĩa (SQLite), để trống để tắt
+CACHE_PERSISTENT_PATH = os.environ.get('NLP_CACHE_PATH', '')
+CACHE_PERSISTENT_MAX_BYTES = _env_int('NLP_CACHE_PERSISTENT_MAX_BYTES', 512 * 1024 * 1024)
+CACHE_PERSISTENT_MAX_ENTRIES = _env_int('NLP_CACHE_PERSISTENT_MAX_ENTRIES', 0)
+CACHE_PERSISTENT_TTL_SECONDS = _env_float('NLP_CACHE_PERSISTENT_TTL_SECONDS', 7 * 24 * 3600.0)
+
+# Version stamp của kết quả phân tích: tăng khi rules/model thay đổi để vô hiệu hóa cache cũ
+CACHE_VERSION = os.environ.get('NLP_CACHE_VERSION', '1')
+
+# Phân tích theo lô (/analyze/batch)
+BATCH_SIZE = _env_int('NLP_BATCH_SIZE', 64)
+BATCH_MAX_ITEMS = _env_int('NLP_BATCH_MAX_ITEMS', 1000)
+
+# Phân tích dạng stream (/analyze/stream)
+STREAM_CHUNK_LINES = _env_int('NLP_STREAM_CHUNK_LINES', 16)
+STREAM_MAX_LINE_BYTES = _env_int('NLP_STREAM_MAX_LINE_BYTES', 64 * 1024)
+
+# Độ dài tối đa của một văn bản trong /analyze, /analyze/batch và mỗi dòng của /analyze/stream
+MAX_TEXT_CHARS = _env_int('NLP_MAX_TEXT_CHARS', 10000)
+
+# Tài liệu dài (/analyze/document): độ dài mỗi phần (không vượt MAX_TEXT_CHARS), dung lượng tối đa
+# và thời gian tối đa cho cả tài liệu (giây, 0 = không giới hạn)
+DOCUMENT_CHUNK_CHARS = _env_int('NLP_DOCUMENT_CHUNK_CHARS', 2000)
+DOCUMENT_MAX_BYTES = _env_int('NLP_DOCUMENT_MAX_BYTES', 16 * 1024 * 1024)
+DOCUMENT_TIME_BUDGET = _env_float('NLP_DOCUMENT_TIME_BUDGET', 0)
+
+# Logging: định dạng text hoặc json, mức log (DEBUG ghi thêm chi tiết token của mỗi request),
+# tỷ lệ lấy mẫu dòng tổng kết của request thành công (lỗi và request chậm hơn LOG_SLOW_MS luôn được ghi)
+# và số record tối đa chờ ghi (đầy thì bỏ bớt thay vì chặn request)
+LOG_FORMAT = os.environ.get('NLP_LOG_FORMAT', 'text')
+LOG_LEVEL = os.environ.get('NLP_LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = _env_float('NLP_LOG_SAMPLE_RATE', 1.0)
+LOG_SLOW_MS = _env_float('NLP_LOG_SLOW_MS', 1000)
+LOG_QUEUE_SIZE = _env_int('NLP_LOG_QUEUE_SIZE', 10000)
+
+# Profiling theo request ("profile" trong /analyze): tắt mặc định, token (header X-Profile-Token) nếu được đặt,
+# thư mục lưu file cProfile/sampling profile và chu kỳ lấy mẫu (giây)
+PROFILE_ENABLED = _env_bool('NLP_PROFILE', False)
+PROFILE_TOKEN = os.environ.get('NLP_PROFILE_TOKEN', '')
+PROFILE_DIR = os.environ.get('NLP_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_SAMPLE_INTERVAL = _env_float('NLP_PROFILE_SAMPLE_INTERVAL', 0.001)
+
+# Nén response theo Accept-Encoding (brotli nếu có thư viện brotli, gzip) khi body lớn hơn COMPRESS_MIN_BYTES
+COMPRESSION = _env_bool('NLP_COMPRESSION', True)
+COMPRESS_MIN_BYTES = _env_int('NLP_COMPRESS_MIN_BYTES', 1024)
+GZIP_LEVEL = _env_int('NLP_GZIP_LEVEL', 5)
+BROTLI_QUALITY = _env_int('NLP_BROTLI_QUALITY', 4)
+
+# Rules sửa nhãn NER/POS, được nạp lại tự động khi file thay đổi (0 = tắt kiểm tra định kỳ)
+RULES_PATH = os.environ.get('NLP_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json'))
+RULES_RELOAD_INTERVAL = _env_float('NLP_RULES_RELOAD_INTERVAL', 5.0)
+
+# spaCy model và profile pipeline: "fast" bỏ các thành phần không dùng tới (parser), "full" nạp đầy đủ
+SPACY_MODEL = os.environ.get('NLP_SPACY_MODEL', 'en_core_web_sm')
+SPACY_PROFILE = os.environ.get('NLP_SPACY_PROFILE', 'fast')
+
+# nltk_analysis cho tiếng Anh/hỗn hợp: mặc định lấy từ spaCy Doc, bật để chạy NLTK riêng như trước
+NLTK_ANALYSIS = _env_bool('NLP_NLTK_ANALYSIS', False)
+
+# Văn bản hỗn hợp Việt/Anh: segments (tách theo đoạn ngôn ngữ, mặc định) hoặc whole (spaCy trên cả văn bản + rules mixed_ner)
+MIXED_ROUTING = os.environ.get('NLP_MIXED_ROUTING', 'segments')
+
+# Nạp models khi khởi động: background (thread nền, mặc định), eager (chờ nạp xong) hoặc off (nạp khi cần)
+WARMUP = os.environ.get('NLP_WARMUP', 'background')
+
+# Chế độ production (gunicorn -c gunicorn.conf.py app:app)
+SERVER_BIND = os.environ.get('NLP_BIND', '0.0.0.0:5000')
+SERVER_WORKERS = _env_int('NLP_WORKERS', os.cpu_count() or 1)
+SERVER_THREADS = _env_int('NLP_THREADS', 1)
+# Số process phục vụ app.py (gunicorn.conf.py đặt theo workers; 1 với server phát triển)
+SERVER_PROCESSES = _env_int('NLP_SERVER_PROCESSES', 1)
+SERVER_TIMEOUT = _env_int('NLP_TIMEOUT', 120)
+# Tái tạo worker sau số request này (0 = không tái tạo), jitter tránh tất cả worker khởi động lại cùng lúc
+SERVER_MAX_REQUESTS = _env_int('NLP_MAX_REQUESTS', 1000)
+SERVER_MAX_REQUESTS_JITTER = _env_int('NLP_MAX_REQUESTS_JITTER', 100)
+
+# Chế độ asyncio (uvicorn asgi:app): số worker process phân tích và số request được phép chờ
+POOL_WORKERS = _env_int('NLP_POOL_WORKERS', os.cpu_count() or 1)
+POOL_QUEUE_DEPTH = _env_int('NLP_POOL_QUEUE_DEPTH', 32)
+POOL_RETRY_AFTER = _env_int('NLP_POOL_RETRY_AFTER', 1)
+POOL_MAX_BODY_BYTES = _env_int('NLP_POOL_MAX_BODY_BYTES', 1024 * 1024)
+POOL_READY_TIMEOUT = _env_float('NLP_POOL_READY_TIMEOUT', 300.0)
@@ -0,0 +1,68 @@
+"""
+Ngân sách thời gian (deadline) của một request phân tích
+Pipeline kiểm tra thời gian còn lại giữa các bước; khi hết thời gian, các bước còn lại bị bỏ qua
+và kết quả trả về chỉ gồm những bước đã hoàn tất
+"""
+
+import math
+import time
+from typing import List, Optional
+
+# Các bước của pipeline theo thứ tự
+STAGES = ('language', 'tokenize', 'pos', 'ner', 'rules')
+
+
+class Deadline:
+    """
+    Thời điểm hết hạn theo time.monotonic() (dùng chung giữa các process trên cùng máy).
+    Khi một bước bị bỏ qua thì mọi bước sau nó cũng bị bỏ qua, vì chúng cần kết quả của bước đó.
+    """
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+        self.skipped: List[str] = []
+
+    @classmethod
+    def after(cls, seconds: float) -> 'Deadline':
+        """Deadline sau `seconds` giây tính từ bây giờ"""
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def from_ms(cls, milliseconds: Optional[float]) -> Optional['Deadline']:
+        """Deadline sau `milliseconds` mili giây, None nếu không giới hạn"""
+        if milliseconds is None:
+            return None
+        return cls.after(milliseconds / 1000.0)
+
+    def remaining(self) -> float:
+        """Số giây còn lại (âm nếu đã quá hạn)"""
+        return self.expires_at - time.monotonic()
+
+    def allow(self, stage: str) -> bool:
+        """True nếu còn thời gian cho bước `stage`, ngược lại ghi nhận bước đó và các bước sau bị bỏ qua"""
+        if stage in self.skipped:
+            return False
+        if self.remaining() > 0:
+            return True
+        for name in STAGES[STAGES.index(stage):]:
+            if name not in self.skipped:
+                self.skipped.append(name)
+        return False
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.skipped)
+
+    def skipped_stages(self) -> List[str]:
+        """Các bước bị bỏ qua theo thứ tự của pipeline"""
+        return [stage for stage in STAGES if stage in self.skipped]
+
+
+def parse_deadline_ms(value) -> Optional[Deadline]:
+    """Đọc trường deadline_ms của request, raise ValueError nếu không phải số dương hữu hạn"""
+    if value is None:
+        return None
+    # NaN/Infinity (JSON của Python chấp nhận) làm mọi phép so sánh với deadline sai
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise ValueError('deadline_ms phải là số dương hữu hạn (mili giây)')
+    return Deadline.from_ms(value)
@@ -0,0 +1,183 @@
+"""
+Phân tích tài liệu dài vượt giới hạn của một request: đọc dần, chia theo đoạn văn/câu,
+phân tích từng phần như một stream và đưa offset entities về vị trí trong tài liệu
+"""
+
+import codecs
+import re
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional
+
+from deadline import Deadline
+from spans import has_span
+
+READ_BYTES = 64 * 1024
+
+# Ranh giới ưu tiên khi chia: đoạn văn, rồi cuối câu, rồi khoảng trắng
+PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n\s*')
+SENTENCE_BREAK = re.compile(r'[.!?…]+["\'”’)\]]*\s+')
+SPACE_BREAK = re.compile(r'\s+')
+
+# start: vị trí ký tự đầu tiên trong tài liệu, separator: khoảng trắng đứng trước phần này,
+# boundary: loại ranh giới đứng trước ('paragraph', 'sentence', 'space', 'hard' hoặc None với phần đầu tiên)
+DocumentChunk = namedtuple('DocumentChunk', ['start', 'text', 'separator', 'boundary'])
+
+
+class DocumentTooLargeError(ValueError):
+    """Tài liệu vượt quá giới hạn dung lượng"""
+
+
+def find_split(text: str, limit: int) -> tuple:
+    """Vị trí chia trong text[:limit] (sau ranh giới) và loại ranh giới, không chia quá sớm trước limit / 2"""
+    window = text[:limit + 1]
+    for boundary, pattern in (('paragraph', PARAGRAPH_BREAK), ('sentence', SENTENCE_BREAK), ('space', SPACE_BREAK)):
+        split = None
+        for match in pattern.finditer(window, limit // 2):
+            if match.start() >= limit:
+                break
+            split = match.end()
+        if split is not None:
+            return min(split, limit), boundary
+    return limit, 'hard'
+
+
+def iter_document_chunks(stream, chunk_chars: int, max_bytes: int) -> Iterator[DocumentChunk]:
+    """
+    Đọc tài liệu UTF-8 từ stream nhị phân và chia thành các phần tối đa chunk_chars ký tự (đã bỏ khoảng trắng
+    ở hai đầu). Bộ nhớ chỉ phụ thuộc chunk_chars; raise DocumentTooLargeError khi đọc quá max_bytes,
+    UnicodeDecodeError nếu tài liệu không phải UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    offset = 0
+    bytes_read = 0
+    eof = False
+    separator = ''
+    boundary = None
+    while buffer or not eof:
+        while not eof and len(buffer) <= chunk_chars:
+            data = stream.read(READ_BYTES)
+            bytes_read += len(data)
+            if bytes_read > max_bytes:
+                raise DocumentTooLargeError(f'Tài liệu quá lớn (tối đa {max_bytes} bytes)')
+            buffer += decoder.decode(data, final=not data)
+            eof = not data
+
+        if len(buffer) <= chunk_chars:
+            split, next_boundary = len(buffer), None
+        else:
+            split, next_boundary = find_split(buffer, chunk_chars)
+        raw = buffer[:split]
+        buffer = buffer[split:]
+
+        text = raw.strip()
+        if text:
+            leading = len(raw) - len(raw.lstrip())
+            yield DocumentChunk(offset + leading, text, separator + raw[:leading], boundary)
+            separator = raw[leading + len(text):]
+            boundary = next_boundary
+        else:
+            # Phần chỉ gồm khoảng trắng: gộp vào khoảng cách trước phần tiếp theo
+            separator = (separator + raw)[-chunk_chars:]
+            boundary = boundary or next_boundary
+        offset += split
+
+
+def _entities(row: Dict) -> List[Dict]:
+    analysis = row.get('result', {}).get('spacy_analysis') or {}
+    return analysis.get('entities', [])
+
+
+def _shift_analysis(analysis: Optional[Dict], offset: int) -> Optional[Dict]:
+    if not analysis:
+        return analysis
+    return dict(analysis, entities=[
+        dict(entity, start=entity['start'] + offset, end=entity['end'] + offset)
+        if has_span(entity) else dict(entity)
+        for entity in analysis.get('entities', [])
+    ])
+
+
+def shift_result(result: Dict, offset: int) -> Dict:
+    """Bản sao kết quả với offset entities và segments tính theo tài liệu (kết quả gốc có thể nằm trong cache)"""
+    shifted = dict(result)
+    analysis = result.get('spacy_analysis')
+    shifted['spacy_analysis'] = _shift_analysis(analysis, offset)
+    vietnamese = result.get('vietnamese_analysis')
+    if vietnamese and vietnamese.get('underthesea_analysis'):
+        # Kết quả mới phân tích dùng chung một dict cho hai trường, kết quả đọc từ cache bền vững thì không
+        underthesea_analysis = vietnamese['underthesea_analysis']
+        shifted['vietnamese_analysis'] = dict(vietnamese, underthesea_analysis=(
+            shifted['spacy_analysis'] if underthesea_analysis is analysis else _shift_analysis(underthesea_analysis, offset)
+        ))
+    if 'segments' in result:
+        shifted['segments'] = [
+            dict(segment, start=segment['start'] + offset, end=segment['end'] + offset)
+            for segment in result['segments']
+        ]
+    return shifted
+
+
+def reconcile_boundary(previous: Dict, current: Dict, chunk: DocumentChunk):
+    """
+    Gộp entity bị cắt đôi ở ranh giới giữa hai phần: entity cuối của phần trước kết thúc đúng ở cuối phần,
+    entity đầu của phần sau bắt đầu đúng ở đầu phần, cùng nhãn và chỉ cách nhau khoảng trắng trên một dòng.
+    Chỉ áp dụng khi phần trước bị cắt giữa câu (ranh giới 'space' hoặc 'hard').
+    """
+    if chunk.boundary not in ('space', 'hard') or '\n' in chunk.separator:
+        return
+    if not previous.get('success') or not current.get('success'):
+        return
+    previous_entities, current_entities = _entities(previous), _entities(current)
+    if not previous_entities or not current_entities:
+        return
+
+    last = max(previous_entities, key=lambda entity: entity.get('end', 0))
+    first = min(current_entities, key=lambda entity: entity.get('start', 0))
+    if last.get('end') != previous['end'] or first.get('start') != current['start']:
+        return
+    if last.get('label') != first.get('label'):
+        return
+
+    last['text'] = last['text'] + chunk.separator + first['text']
+    last['end'] = first['end']
+    current_entities.remove(first)
+
+
+def analyze_document(analyzer, chunks: Iterator[DocumentChunk], use_nltk: Optional[bool] = None,
+                     deadline: Optional[Deadline] = None) -> Iterator[Dict]:
+    """
+    Phân tích từng phần của tài liệu, trả về một dòng kết quả cho mỗi phần rồi một dòng tổng kết.
+    Mỗi phần được trả về sau khi phần kế tiếp đã được phân tích để gộp entities ở ranh giới
+    (bộ nhớ giữ tối đa hai phần). Khi hết deadline, dừng lại và đánh dấu kết quả là partial.
+    """
+    previous = None
+    count = 0
+    characters = 0
+    partial = False
+    for chunk in chunks:
+        if deadline is not None and deadline.remaining() <= 0:
+            partial = True
+            break
+
+        end = chunk.start + len(chunk.text)
+        row = {'chunk': count, 'start': chunk.start, 'end': end}
+        result = analyzer.analyze_text(chunk.text, use_nltk, deadline)
+        if result is None:
+            row.update({'success': False, 'error': 'Không thể phân tích văn bản'})
+        else:
+            row.update({'success': True, 'result': shift_result(result, chunk.start)})
+
+        if previous is not None:
+            reconcile_boundary(previous, row, chunk)
+            yield previous
+        previous = row
+        count += 1
+        characters = end
+        if result is not None and result.get('partial'):
+            partial = True
+            break
+
+    if previous is not None:
+        yield previous
+    yield {'done': True, 'chunks': count, 'characters': characters, 'partial': partial}
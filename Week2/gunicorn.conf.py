@@ -0,0 +1,47 @@
+"""
+Cấu hình gunicorn cho chế độ production (pre-fork)
+Models được nạp một lần trong master trước khi fork, các worker dùng chung bộ nhớ model (copy-on-write)
+
+Chạy: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import gc
+import os
+
+# Master phải nạp xong models trước khi fork: thread warm-up nền không còn tồn tại trong worker
+if os.environ.get('NLP_WARMUP', 'background') == 'background':
+    os.environ['NLP_WARMUP'] = 'eager'
+
+# Không đặt tên "config": gunicorn coi mọi tên ở cấp module là một setting
+import config as nlp_config
+
+bind = nlp_config.SERVER_BIND
+workers = nlp_config.SERVER_WORKERS
+# Cho app.py biết số process: cache trong bộ nhớ của mỗi worker là riêng
+os.environ['NLP_SERVER_PROCESSES'] = str(workers)
+# gthread: heartbeat không bị chặn bởi request dài (ví dụ /analyze/stream)
+worker_class = 'gthread'
+threads = nlp_config.SERVER_THREADS
+timeout = nlp_config.SERVER_TIMEOUT
+max_requests = nlp_config.SERVER_MAX_REQUESTS
+max_requests_jitter = nlp_config.SERVER_MAX_REQUESTS_JITTER
+
+# Import app.py (và nạp models) trong master, trước khi fork các worker
+preload_app = True
+
+# Tắt GC khi nạp models: tránh các lần thu gom vô ích trên hàng triệu objects mới tạo
+gc.disable()
+
+
+def when_ready(server):
+    """Models đã nạp xong trong master: đóng băng mọi objects hiện có trước khi fork"""
+    # Các objects bị đóng băng chuyển sang thế hệ permanent, GC trong worker không duyệt
+    # và không ghi vào header của chúng, nên các trang bộ nhớ của models vẫn được dùng chung
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Đã đóng băng {gc.get_freeze_count()} objects trước khi fork {server.num_workers} workers")
+
+
+def post_fork(server, worker):
+    """Bật lại GC trong worker (chỉ áp dụng cho objects tạo sau khi fork)"""
+    gc.enable()
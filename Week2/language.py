@@ -0,0 +1,161 @@
+"""
+Nhận diện chữ viết và ngôn ngữ bằng một lần duyệt văn bản
+Văn bản rõ ràng là tiếng Việt hoặc tiếng Anh được quyết định ngay, chỉ văn bản không rõ ràng mới cần langdetect
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+WORD_PATTERN = re.compile(r'\w+')
+# Ranh giới mệnh đề khi tách văn bản hỗn hợp: dấu câu theo sau là khoảng trắng, hoặc xuống dòng
+CLAUSE_BOUNDARY = re.compile(r'[.!?;:,]+\s+|\n\s*')
+
+_VIETNAMESE_LOWER = 'àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ'
+
+# Ký tự có dấu dùng để đếm từ tiếng Việt khi kiểm tra văn bản hỗn hợp (giữ nguyên như trước: chữ thường và 'Đ')
+VIETNAMESE_CHARS = frozenset(_VIETNAMESE_LOWER + 'Đ')
+
+# Ký tự chỉ gặp trong tiếng Việt: bỏ các nguyên âm có dấu sắc/huyền/mũ/ngã đơn giản cũng có trong tiếng Pháp,
+# Tây Ban Nha, Bồ Đào Nha (à, é, ê, õ...), giữ ă, ơ, ư, đ, dấu hỏi, dấu nặng và các dấu kép
+VIETNAMESE_ONLY_CHARS = frozenset(
+    char for char in _VIETNAMESE_LOWER + _VIETNAMESE_LOWER.upper()
+    if char.lower() not in 'àáâãèéêìíòóôõùúý'
+)
+
+# Từ tiếng Anh thông thường dùng trong điều kiện văn bản hỗn hợp (giữ nguyên như trước)
+MIXED_ENGLISH_WORDS = frozenset([
+    'the', 'is', 'are', 'was', 'were', 'have', 'has', 'had', 'will', 'would', 'can', 'could', 'should', 'may', 'might'
+])
+
+# Hư từ tiếng Anh ít gặp trong các ngôn ngữ dùng chữ Latinh khác, dùng để nhận diện nhanh tiếng Anh
+ENGLISH_FUNCTION_WORDS = frozenset([
+    'the', 'and', 'of', 'to', 'is', 'are', 'was', 'were', 'that', 'with', 'this', 'for', 'from', 'has', 'have',
+    'had', 'been', 'will', 'would', 'which', 'their', 'they', 'it', 'its', 'by', 'be', 'at', 'as', 'an', 'or',
+    'not', 'but', 'can', 'could', 'should', 'who', 'what', 'there', 'these', 'those', 'our', 'we', 'you', 'he', 'she'
+])
+
+# Ngưỡng quyết định nhanh
+VIETNAMESE_ONLY_MIN_WORDS = 2
+VIETNAMESE_ONLY_MIN_RATIO = 0.15
+ENGLISH_FUNCTION_MIN_WORDS = 3
+ENGLISH_FUNCTION_MIN_RATIO = 0.2
+ENGLISH_MAX_NON_ASCII_RATIO = 0.05
+# Mệnh đề được coi là tiếng Việt khi từ có dấu chiếm ít nhất tỷ lệ này trong các từ chữ cái
+CLAUSE_VIETNAMESE_MIN_RATIO = 0.3
+
+
+class TextProfile:
+    """Thống kê chữ viết của văn bản sau một lần duyệt các từ"""
+
+    def __init__(self):
+        self.words = 0
+        self.latin_words = 0
+        self.non_ascii_words = 0
+        self.vietnamese_words = 0
+        self.vietnamese_only_words = 0
+        self.mixed_english_words = 0
+        self.english_function_words = 0
+
+    @property
+    def is_mixed(self) -> bool:
+        """Văn bản hỗn hợp (tiếng Việt + tiếng Anh), cùng điều kiện với bản kiểm tra trước đây"""
+        total_words = self.latin_words + self.vietnamese_words
+        if total_words == 0:
+            return False
+
+        # Chỉ coi là mixed khi có ít nhất 5 từ tiếng Anh và 5 từ tiếng Việt, tiếng Anh chiếm 30-70%
+        # và có ít nhất 2 từ tiếng Anh thông thường (không phải chỉ là tên riêng hoặc từ viết tắt)
+        english_ratio = self.latin_words / total_words
+        return (self.latin_words >= 5 and self.vietnamese_words >= 5 and 0.3 <= english_ratio <= 0.7
+                and self.mixed_english_words >= 2)
+
+    def confident_language(self) -> Optional[str]:
+        """'vi' hoặc 'en' khi văn bản rõ ràng, None nếu cần langdetect"""
+        if (self.vietnamese_only_words >= VIETNAMESE_ONLY_MIN_WORDS
+                and self.vietnamese_only_words >= VIETNAMESE_ONLY_MIN_RATIO * self.words):
+            return 'vi'
+        if (self.english_function_words >= ENGLISH_FUNCTION_MIN_WORDS
+                and self.english_function_words >= ENGLISH_FUNCTION_MIN_RATIO * self.latin_words
+                and self.non_ascii_words <= ENGLISH_MAX_NON_ASCII_RATIO * self.words):
+            return 'en'
+        return None
+
+
+def profile_text(text: str) -> TextProfile:
+    """Đếm từ Latinh, từ có dấu tiếng Việt và hư từ tiếng Anh trong một lần duyệt"""
+    profile = TextProfile()
+    for match in WORD_PATTERN.finditer(text):
+        word = match.group()
+        profile.words += 1
+        if word.isascii():
+            # Từ chỉ gồm chữ cái A-Z (tương đương \b[A-Za-z]+\b)
+            if word.isalpha():
+                profile.latin_words += 1
+                word_lower = word.lower()
+                if word_lower in ENGLISH_FUNCTION_WORDS:
+                    profile.english_function_words += 1
+                if word_lower in MIXED_ENGLISH_WORDS:
+                    profile.mixed_english_words += 1
+            continue
+
+        profile.non_ascii_words += 1
+        if not VIETNAMESE_CHARS.isdisjoint(word):
+            profile.vietnamese_words += 1
+        if not VIETNAMESE_ONLY_CHARS.isdisjoint(word):
+            profile.vietnamese_only_words += 1
+    return profile
+
+
+def detection_sample(text: str, size: int) -> str:
+    """
+    Đoạn mẫu cho langdetect: văn bản ngắn dùng nguyên văn, văn bản dài lấy ba đoạn ở đầu, giữa và cuối
+    (cắt theo khoảng trắng) để không chỉ dựa vào phần mở đầu
+    """
+    if len(text) <= size:
+        return text
+    window = max(size // 3, 1)
+    middle = (len(text) - window) // 2
+    parts = []
+    for start in (0, middle, len(text) - window):
+        part = text[start:start + window]
+        # Bỏ từ bị cắt dở ở hai đầu của đoạn
+        if start > 0 and ' ' in part:
+            part = part[part.index(' ') + 1:]
+        if start + window < len(text) and ' ' in part:
+            part = part[:part.rindex(' ')]
+        parts.append(part)
+    return ' '.join(parts)
+
+
+def clause_language(profile: TextProfile) -> Optional[str]:
+    """Ngôn ngữ của một mệnh đề: 'vi', 'en' hoặc None nếu không đủ dấu hiệu (ví dụ chỉ có tên riêng)"""
+    letter_words = profile.latin_words + profile.vietnamese_words
+    if profile.vietnamese_words and profile.vietnamese_words >= CLAUSE_VIETNAMESE_MIN_RATIO * letter_words:
+        return 'vi'
+    if profile.english_function_words:
+        return 'en'
+    return None
+
+
+def split_language_runs(text: str, default: str = 'vi') -> List[Tuple[int, int, str]]:
+    """
+    Chia văn bản hỗn hợp thành các đoạn liên tiếp cùng ngôn ngữ (start, end, 'vi' | 'en') phủ kín văn bản.
+    Văn bản được tách theo mệnh đề; mệnh đề không rõ ngôn ngữ được gộp vào đoạn đứng trước (hoặc đoạn đầu tiên).
+    """
+    runs: List[List] = []
+    start = 0
+    boundaries = [match.end() for match in CLAUSE_BOUNDARY.finditer(text)]
+    for end in boundaries + [len(text)]:
+        if end <= start:
+            continue
+        language = clause_language(profile_text(text[start:end]))
+        if runs and (language is None or language == runs[-1][2]):
+            runs[-1][1] = end
+        elif language is not None:
+            # Đoạn đầu tiên bao gồm cả các mệnh đề không rõ ngôn ngữ đứng trước nó
+            runs.append([start if runs else 0, end, language])
+        start = end
+    if not runs:
+        return [(0, len(text), default)]
+    runs[-1][1] = len(text)
+    return [tuple(run) for run in runs]
@@ -0,0 +1,123 @@
+"""
+Chọn các layer của kết quả phân tích (tham số layers/fields của request): language (luôn có), tokens, pos, entities.
+Pipeline bỏ qua các bước chỉ phục vụ layer không được yêu cầu; cache lưu riêng từng layer
+để kết quả một phần được bổ sung ở các request sau mà không phân tích lại các layer đã có
+"""
+
+from typing import Dict, FrozenSet, Iterable, Optional
+
+LAYERS = ('language', 'tokens', 'pos', 'entities')
+
+# Các trường (đường dẫn trong kết quả) thuộc từng layer
+LAYER_FIELDS = {
+    'language': (('language',), ('detected_language',), ('segments',)),
+    'tokens': (('nltk_analysis', 'tokens'), ('vietnamese_analysis', 'tokens')),
+    'pos': (
+        ('nltk_analysis', 'pos_tags'),
+        ('spacy_analysis', 'tokens_with_pos'),
+        ('vietnamese_analysis', 'pos_tags'),
+        ('vietnamese_analysis', 'underthesea_analysis', 'tokens_with_pos')
+    ),
+    'entities': (
+        ('spacy_analysis', 'entities'),
+        ('vietnamese_analysis', 'underthesea_analysis', 'entities'),
+        ('confidence_score',)
+    )
+}
+# Trường của kết quả một phần (deadline), giữ lại với mọi lựa chọn layer
+META_FIELDS = (('partial',), ('skipped_stages',))
+
+# Thứ tự khóa như kết quả đầy đủ, dùng khi ghép các layer
+KEY_ORDER = (
+    'language', 'detected_language', 'nltk_analysis', 'spacy_analysis', 'vietnamese_analysis', 'segments',
+    'confidence_score', 'layers', 'partial', 'skipped_stages',
+    'tokens', 'pos_tags', 'underthesea_analysis', 'tokens_with_pos', 'entities'
+)
+_KEY_RANK = {key: rank for rank, key in enumerate(KEY_ORDER)}
+
+
+def parse_layers(value) -> Optional[FrozenSet[str]]:
+    """
+    Đọc trường layers/fields của request (danh sách hoặc chuỗi phân tách bằng dấu phẩy).
+    None = đầy đủ mọi layer; language luôn được thêm vào. Raise ValueError nếu không hợp lệ
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not all(isinstance(layer, str) for layer in value):
+        raise ValueError(f'layers phải là danh sách gồm: {", ".join(LAYERS)}')
+    unknown = sorted(set(value) - set(LAYERS))
+    if unknown:
+        raise ValueError(f'Layer không hợp lệ: {", ".join(unknown)} (chọn trong: {", ".join(LAYERS)})')
+    layers = frozenset(value) | {'language'}
+    return None if len(layers) == len(LAYERS) else layers
+
+
+def wants(layers: Optional[FrozenSet[str]], layer: str) -> bool:
+    """Layer có được yêu cầu không (None = mọi layer)"""
+    return layers is None or layer in layers
+
+
+def analyzes(layers: Optional[FrozenSet[str]]) -> bool:
+    """Có cần tách từ/phân tích không: False khi chỉ yêu cầu nhận diện ngôn ngữ"""
+    return layers is None or len(layers) > 1
+
+
+def _copy_path(source: Dict, target: Dict, path: tuple):
+    for key in path[:-1]:
+        if key not in source:
+            return
+        if source[key] is None:
+            # Ví dụ spacy_analysis = None khi không có spaCy model
+            target.setdefault(key, None)
+            return
+        source = source[key]
+        target = target.setdefault(key, {})
+    if path[-1] in source:
+        target[path[-1]] = source[path[-1]]
+
+
+def order_keys(result: Dict) -> Dict:
+    """Sắp xếp khóa (cả các dict lồng nhau) theo thứ tự của kết quả đầy đủ"""
+    ordered = sorted(result.items(), key=lambda item: _KEY_RANK.get(item[0], len(KEY_ORDER)))
+    return {key: order_keys(value) if isinstance(value, dict) else value for key, value in ordered}
+
+
+def select_layers(result: Dict, layers: Iterable[str]) -> Dict:
+    """Bản sao kết quả chỉ gồm các trường của layers đã chọn (các list bên trong được dùng chung, không sao chép)"""
+    selected: Dict = {}
+    for layer in LAYERS:
+        if layer in layers:
+            for path in LAYER_FIELDS[layer]:
+                _copy_path(result, selected, path)
+    for path in META_FIELDS:
+        _copy_path(result, selected, path)
+    return order_keys(selected)
+
+
+def _merge(target: Dict, source: Dict):
+    for key, value in source.items():
+        if isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        elif key not in target or target[key] is None:
+            target[key] = value
+
+
+def merge_layers(fragments: Iterable[Dict]) -> Dict:
+    """Ghép các kết quả theo layer (từ cache hoặc vừa phân tích) thành một kết quả"""
+    merged: Dict = {}
+    for fragment in fragments:
+        _merge(merged, fragment)
+    return order_keys(merged)
+
+
+def with_layers(result: Dict, layers: Optional[FrozenSet[str]]) -> Dict:
+    """Kết quả trả về cho request: đầy đủ khi layers là None, ngược lại chỉ các layer được chọn kèm danh sách layers"""
+    if layers is None:
+        return result
+    selected = select_layers(result, layers)
+    selected['layers'] = [layer for layer in LAYERS if layer in layers]
+    return order_keys(selected)
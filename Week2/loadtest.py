@@ -0,0 +1,296 @@
+"""
+Load test closed-loop cho HTTP service: mỗi client gửi một request, chờ response rồi gửi request tiếp theo.
+Tăng dần số client để vẽ đường throughput - độ trễ và tìm điểm bão hòa; với --start, server gunicorn
+được khởi động cục bộ cho từng số worker để so sánh.
+
+Ví dụ:
+    python loadtest.py --start --workers 1,2,4 --concurrency 1,2,4,8,16,32
+    python loadtest.py --url http://127.0.0.1:5000 --endpoint batch --batch-size 16
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+from bench import LANGUAGE_PATHS, load_examples, percentile
+
+DEFAULT_MIX = 'vietnamese=0.6,english=0.3,mixed=0.1'
+ENDPOINTS = {'analyze': '/analyze', 'batch': '/analyze/batch'}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'vietnamese=0.6,english=0.3,mixed=0.1' -> tỉ lệ theo nhánh (được chuẩn hóa về tổng 1)"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in LANGUAGE_PATHS:
+            raise ValueError(f'Nhánh không hợp lệ: {name}')
+        mix[name] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError('Tổng tỉ lệ phải lớn hơn 0')
+    return {name: weight / total for name, weight in mix.items()}
+
+
+class Workload:
+    """Sinh văn bản theo tỉ lệ ngôn ngữ; phần lớn văn bản được làm khác nhau để không trúng cache của server"""
+
+    def __init__(self, examples: Dict[str, List[str]], mix: Dict[str, float], repeat_ratio: float, seed: int):
+        self.paths = [name for name in mix if examples.get(name)]
+        self.weights = [mix[name] for name in self.paths]
+        self.examples = examples
+        self.repeat_ratio = repeat_ratio
+        self._random = random.Random(seed)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next_text(self) -> str:
+        with self._lock:
+            language_path = self._random.choices(self.paths, self.weights)[0]
+            text = self._random.choice(self.examples[language_path])
+            if self._random.random() < self.repeat_ratio:
+                return text
+            self._counter += 1
+            return f'{text} ({self._counter})'
+
+
+class Target:
+    """Địa chỉ server và endpoint cần tải"""
+
+    def __init__(self, url: str, endpoint: str, batch_size: int, timeout: float):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.path = ENDPOINTS[endpoint]
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+    def body(self, workload: Workload) -> bytes:
+        if self.endpoint == 'batch':
+            payload = {'texts': [workload.next_text() for _ in range(self.batch_size)]}
+        else:
+            payload = {'text': workload.next_text()}
+        return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+    def texts_per_request(self) -> int:
+        return self.batch_size if self.endpoint == 'batch' else 1
+
+
+def client_loop(target: Target, workload: Workload, stop: threading.Event, measure_from: float, samples: List):
+    """Một client closed-loop trên một kết nối keep-alive; ghi (độ trễ, status) của các request sau measure_from"""
+    connection = None
+    while not stop.is_set():
+        if connection is None:
+            connection = http.client.HTTPConnection(target.host, target.port, timeout=target.timeout)
+        body = target.body(workload)
+        started = time.perf_counter()
+        try:
+            connection.request('POST', target.path, body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException):
+            status = 0
+            connection.close()
+            connection = None
+        finished = time.perf_counter()
+        if started >= measure_from and not stop.is_set():
+            samples.append((finished - started, status))
+    if connection is not None:
+        connection.close()
+
+
+def run_level(target: Target, workload: Workload, concurrency: int, duration: float, warmup: float) -> Dict:
+    """Chạy `concurrency` client trong warmup + duration giây, thống kê phần sau warmup"""
+    samples: List = []
+    stop = threading.Event()
+    measure_from = time.perf_counter() + warmup
+    clients = [
+        threading.Thread(target=client_loop, args=(target, workload, stop, measure_from, samples), daemon=True)
+        for _ in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    time.sleep(warmup + duration)
+    stop.set()
+    for client in clients:
+        client.join(target.timeout)
+
+    ok = [latency for latency, status in samples if status == 200]
+    statuses: Dict[str, int] = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    row = {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'statuses': statuses,
+        'throughput_rps': round(len(ok) / duration, 2),
+        'texts_per_s': round(len(ok) * target.texts_per_request() / duration, 2)
+    }
+    if ok:
+        row.update({
+            'p50_ms': round(percentile(ok, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(ok, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(ok, 0.99) * 1000, 2)
+        })
+    return row
+
+
+def find_saturation(rows: List[Dict], min_gain: float, p99_limit: Optional[float]) -> Optional[Dict]:
+    """
+    Điểm bão hòa: mức tải cuối cùng mà throughput vẫn tăng ít nhất min_gain so với mức trước,
+    không có lỗi và p99 nằm trong p99_limit (nếu có). Sau điểm này thêm client chỉ làm tăng độ trễ.
+    """
+    saturation = None
+    previous = None
+    for row in rows:
+        if row['errors'] or 'p99_ms' not in row or (p99_limit is not None and row['p99_ms'] > p99_limit):
+            break
+        if previous is not None and row['throughput_rps'] < previous['throughput_rps'] * (1 + min_gain):
+            break
+        saturation = previous = row
+    return saturation
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(workers: int, threads: int, ready_timeout: float) -> tuple:
+    """Khởi động gunicorn (gunicorn.conf.py) trên cổng trống, chờ /health/ready trả về 200"""
+    port = free_port()
+    env = dict(os.environ, NLP_BIND=f'127.0.0.1:{port}', NLP_WORKERS=str(workers), NLP_THREADS=str(threads),
+               NLP_LOG_SAMPLE_RATE=os.environ.get('NLP_LOG_SAMPLE_RATE', '0'))
+    directory = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn đã dừng (exit code {process.returncode})')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health/ready')
+            if connection.getresponse().status == 200:
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f'Server chưa sẵn sàng sau {ready_timeout} giây')
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def sweep(target: Target, workload: Workload, levels: Sequence[int], args) -> Dict:
+    rows = []
+    for concurrency in levels:
+        row = run_level(target, workload, concurrency, args.duration, args.warmup)
+        rows.append(row)
+        print(f"  c={concurrency:<4} {row['throughput_rps']:>8.1f} req/s {row['texts_per_s']:>8.1f} văn bản/s"
+              f"  p50 {row.get('p50_ms', '-'):>8} ms  p95 {row.get('p95_ms', '-'):>8} ms"
+              f"  p99 {row.get('p99_ms', '-'):>8} ms  lỗi {row['errors']}", flush=True)
+    saturation = find_saturation(rows, args.min_gain, args.p99_limit)
+    if saturation:
+        print(f"  bão hòa tại c={saturation['concurrency']}: {saturation['throughput_rps']} req/s,"
+              f" p99 {saturation['p99_ms']} ms")
+    else:
+        print('  không tìm được mức tải thỏa điều kiện (lỗi hoặc p99 vượt giới hạn ngay từ mức đầu)')
+    return {'levels': rows, 'saturation': saturation}
+
+
+def parse_ints(value: str) -> List[int]:
+    numbers = [int(part) for part in value.split(',') if part.strip()]
+    if not numbers or min(numbers) < 1:
+        raise ValueError(value)
+    return numbers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test closed-loop cho /analyze và /analyze/batch')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server đang chạy (bỏ qua khi dùng --start)')
+    parser.add_argument('--start', action='store_true', help='Khởi động gunicorn cục bộ cho từng số worker')
+    parser.add_argument('--workers', default='1', help='Số worker gunicorn cần so sánh (với --start), ví dụ 1,2,4')
+    parser.add_argument('--threads', type=int, default=1, help='Số thread mỗi worker (với --start)')
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='analyze')
+    parser.add_argument('--batch-size', type=int, default=16, help='Số văn bản mỗi request với --endpoint batch')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32', help='Các mức số client đồng thời')
+    parser.add_argument('--duration', type=float, default=10, help='Thời gian đo mỗi mức (giây)')
+    parser.add_argument('--warmup', type=float, default=2, help='Thời gian chạy trước khi đo mỗi mức (giây)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Tỉ lệ ngôn ngữ (mặc định: {DEFAULT_MIX})')
+    parser.add_argument('--repeat-ratio', type=float, default=0.0,
+                        help='Tỉ lệ request dùng lại nguyên văn bản mẫu (có thể trúng cache của server)')
+    parser.add_argument('--min-gain', type=float, default=0.1,
+                        help='Throughput tăng ít hơn tỉ lệ này khi thêm client được coi là đã bão hòa')
+    parser.add_argument('--p99-limit', type=float, help='Giới hạn p99 (ms) khi tìm điểm bão hòa')
+    parser.add_argument('--timeout', type=float, default=60, help='Timeout mỗi request (giây)')
+    parser.add_argument('--ready-timeout', type=float, default=300, help='Thời gian chờ server sẵn sàng (giây)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        levels = parse_ints(args.concurrency)
+        worker_counts = parse_ints(args.workers)
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.batch_size < 1 or args.duration <= 0 or args.warmup < 0:
+        parser.error('--batch-size, --duration phải lớn hơn 0 và --warmup không âm')
+
+    workload = Workload(load_examples(), mix, args.repeat_ratio, args.seed)
+    report = {'endpoint': args.endpoint, 'mix': mix, 'duration': args.duration, 'runs': []}
+
+    if not args.start:
+        print(f'{args.url} {ENDPOINTS[args.endpoint]}')
+        target = Target(args.url, args.endpoint, args.batch_size, args.timeout)
+        report['runs'].append(dict(sweep(target, workload, levels, args), url=args.url))
+    else:
+        for workers in worker_counts:
+            print(f'gunicorn workers={workers} threads={args.threads} {ENDPOINTS[args.endpoint]}', flush=True)
+            process, url = start_server(workers, args.threads, args.ready_timeout)
+            try:
+                target = Target(url, args.endpoint, args.batch_size, args.timeout)
+                report['runs'].append(dict(sweep(target, workload, levels, args), workers=workers, threads=args.threads))
+            finally:
+                stop_server(process)
+        if len(report['runs']) > 1:
+            print('Throughput tại điểm bão hòa theo số worker:')
+            for run in report['runs']:
+                saturation = run['saturation'] or {}
+                print(f"  workers={run['workers']:<3} {saturation.get('throughput_rps', '-')} req/s"
+                      f"  p99 {saturation.get('p99_ms', '-')} ms  (c={saturation.get('concurrency', '-')})")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Logging không chặn request: log record được đưa vào hàng đợi, một thread nền ghi ra stderr.
+Mỗi request /analyze ghi một dòng tổng kết (text hoặc JSON), có thể lấy mẫu; chi tiết token chỉ ghi ở mức DEBUG
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+import config
+
+request_logger = logging.getLogger('nlp.request')
+
+# Các thuộc tính có sẵn của LogRecord, không đưa vào trường JSON
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def extra_fields(record: logging.LogRecord) -> Dict:
+    """Các trường truyền qua extra của log record"""
+    return {
+        key: value for key, value in vars(record).items()
+        if key not in _RECORD_ATTRIBUTES and not key.startswith('_')
+    }
+
+
+class TextFormatter(logging.Formatter):
+    """Định dạng text, các trường extra được nối vào cuối dòng dạng key=value"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi log record là một dòng JSON, kèm các trường truyền qua extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        payload.update(extra_fields(record))
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler với hàng đợi có giới hạn: khi đầy thì bỏ record (đếm số record bị bỏ) thay vì chặn request.
+    Thread ghi log được (khởi động lại) trong process hiện tại khi cần, kể cả sau khi gunicorn fork worker.
+    """
+
+    def __init__(self, target: logging.Handler, max_size: int):
+        super().__init__(queue.Queue(max_size))
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Thread ghi log của process cha không tồn tại sau fork
+                self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def enqueue(self, record: logging.LogRecord):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None) -> NonBlockingQueueHandler:
+    """Cấu hình root logger một lần cho mỗi process: ghi qua hàng đợi, định dạng text hoặc json"""
+    global _handler
+    if _handler is not None:
+        return _handler
+
+    log_format = log_format or config.LOG_FORMAT
+    target = logging.StreamHandler(sys.stderr)
+    if log_format == 'json':
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    _handler = NonBlockingQueueHandler(target, config.LOG_QUEUE_SIZE)
+    # Ghi nốt các record còn trong hàng đợi khi process kết thúc
+    atexit.register(_handler.stop)
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel((level or config.LOG_LEVEL).upper())
+    return _handler
+
+
+def should_log_request(status: int, duration_ms: float) -> bool:
+    """Lỗi và request chậm luôn được ghi, các request khác được lấy mẫu theo LOG_SAMPLE_RATE"""
+    if status >= 400 or duration_ms >= config.LOG_SLOW_MS:
+        return True
+    return random.random() < config.LOG_SAMPLE_RATE
+
+
+def log_request(endpoint: str, status: int, started: float, text: Optional[str] = None,
+                result: Optional[Dict] = None, error: Optional[str] = None):
+    """Một dòng tổng kết cho mỗi request (không ghi nội dung văn bản), chi tiết token chỉ ở mức DEBUG"""
+    duration_ms = (time.perf_counter() - started) * 1000
+    if not should_log_request(status, duration_ms):
+        return
+
+    fields = {'endpoint': endpoint, 'status': status, 'duration_ms': round(duration_ms, 2)}
+    if text is not None:
+        fields['chars'] = len(text)
+    if error is not None:
+        fields['error'] = error
+    if result is not None:
+        if result.get('schema') == 'v2':
+            # Kết quả dạng cột (schema.compact_result)
+            tokens = len(result.get('tokens', {}).get('text', []))
+            entities = len(result.get('entities', {}).get('text', []))
+        else:
+            tokens = len(result.get('nltk_analysis', {}).get('tokens', []))
+            entities = len((result.get('spacy_analysis') or {}).get('entities', []))
+        fields.update({
+            'language': result.get('language'),
+            'detected_language': result.get('detected_language'),
+            'tokens': tokens,
+            'entities': entities,
+            'confidence': result.get('confidence_score'),
+            'partial': result.get('partial', False)
+        })
+
+    request_logger.log(logging.WARNING if status >= 500 else logging.INFO, 'request', extra=fields)
+
+    if result is not None and request_logger.isEnabledFor(logging.DEBUG):
+        analysis = result.get('spacy_analysis') or {}
+        request_logger.debug('analysis details', extra={
+            'pos_tags': result.get('nltk_analysis', {}).get('pos_tags', []),
+            'entity_list': [(entity['text'], entity['label']) for entity in analysis.get('entities', [])],
+            'tokens_with_pos': analysis.get('tokens_with_pos', [])
+        })
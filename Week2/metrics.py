@@ -0,0 +1,226 @@
+"""
+Metrics theo định dạng text của Prometheus (không cần thư viện ngoài): counter, gauge và histogram có nhãn,
+thời gian từng bước của pipeline, số request theo nhánh ngôn ngữ và kích thước payload.
+Mỗi process có registry riêng (gunicorn: mỗi worker báo số liệu của chính nó)
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from profiling import record_stage
+
+# Bucket mặc định cho thời gian (giây)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bucket cho kích thước payload (bytes)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Metric có nhãn, các giá trị được lưu theo bộ giá trị nhãn"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} cần các nhãn {self.labelnames}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    """Giá trị chỉ tăng"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(Counter):
+    """Giá trị tăng giảm tùy ý"""
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Phân phối giá trị theo các bucket cố định (cộng dồn như Prometheus)"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [số lần theo từng bucket..., tổng, số lần]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian của khối lệnh (giây)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        samples = []
+        for key, state in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f'{self.name}_bucket', dict(labels, le='+Inf'), state[-1]))
+            samples.append((f'{self.name}_sum', labels, state[-2]))
+            samples.append((f'{self.name}_count', labels, state[-1]))
+        return samples
+
+
+class StageHistogram(Histogram):
+    """Histogram thời gian từng bước, đồng thời ghi vào trace của request đang được profile"""
+
+    def observe(self, value: float, **labels):
+        super().observe(value, **labels)
+        record_stage(labels['stage'], value)
+
+
+class Registry:
+    """Tập hợp metrics và các collector (hàm trả về metrics được tính lúc xuất, ví dụ thống kê cache)"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Xuất toàn bộ metrics theo định dạng text của Prometheus"""
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            metrics.extend(collector())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+ANALYSES = REGISTRY.register(Counter(
+    'nlp_analyses_total', 'Số văn bản đã phân tích (không tính cache hit) theo nhánh ngôn ngữ', ['language']
+))
+STAGE_SECONDS = REGISTRY.register(StageHistogram(
+    'nlp_stage_duration_seconds', 'Thời gian từng bước của pipeline phân tích', ['stage']
+))
+REQUESTS = REGISTRY.register(Counter(
+    'nlp_requests_total', 'Số request HTTP theo endpoint và status', ['endpoint', 'status']
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'nlp_request_duration_seconds', 'Thời gian xử lý request HTTP', ['endpoint']
+))
+REQUEST_BYTES = REGISTRY.register(Histogram(
+    'nlp_request_payload_bytes', 'Kích thước body của request', ['endpoint'], buckets=SIZE_BUCKETS
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'nlp_requests_in_flight', 'Số request đang được xử lý (đang chờ hoặc đang chạy)'
+))
+
+
+def timed(stage: str):
+    """Decorator ghi thời gian chạy của hàm vào nlp_stage_duration_seconds{stage=...}"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage=stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_metrics(stats: Dict) -> List[Metric]:
+    """Metrics từ thống kê cache (AnalysisCache/SQLiteCache/TieredCache.stats())"""
+    tiers = [(stats.get('backend', 'memory'), stats)]
+    if 'persistent' in stats:
+        tiers.append((stats['persistent'].get('backend', 'persistent'), stats['persistent']))
+
+    lookups = Counter('nlp_cache_lookups_total', 'Số lần tra cache theo tầng và kết quả', ['tier', 'result'])
+    evictions = Counter('nlp_cache_evictions_total', 'Số entries bị loại khỏi cache', ['tier'])
+    entries = Gauge('nlp_cache_entries', 'Số entries trong cache', ['tier'])
+    size = Gauge('nlp_cache_bytes', 'Dung lượng cache (bytes)', ['tier'])
+    for tier, tier_stats in tiers:
+        lookups.inc(tier_stats.get('hits', 0), tier=tier, result='hit')
+        lookups.inc(tier_stats.get('misses', 0), tier=tier, result='miss')
+        evictions.inc(tier_stats.get('evictions', 0), tier=tier)
+        entries.set(tier_stats.get('entries', 0), tier=tier)
+        size.set(tier_stats.get('bytes', 0), tier=tier)
+    return [lookups, evictions, entries, size]
@@ -0,0 +1,193 @@
+"""
+Profiling theo từng request (chỉ khi được bật trong cấu hình): thời gian của từng method TextAnalyzer
+và từng bước pipeline mà request đi qua, tùy chọn lưu file cProfile hoặc sampling profile trên server
+"""
+
+import contextvars
+import cProfile
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import config
+
+PROFILE_MODES = ('timing', 'cprofile', 'sample')
+
+# Trace của request đang được profile (None với request bình thường)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('nlp_profile_trace', default=None)
+
+
+class Trace:
+    """Tổng thời gian và số lần gọi theo tên (method hoặc bước), dùng chung giữa các thread của request"""
+
+    def __init__(self):
+        self.methods: Dict[str, list] = {}
+        self.stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, table: Dict[str, list], name: str, seconds: float):
+        with self._lock:
+            entry = table.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    @staticmethod
+    def _report(table: Dict[str, list]) -> List[Dict]:
+        # Danh sách (không phải dict) để giữ thứ tự theo tổng thời gian giảm dần trong JSON
+        ordered = sorted(table.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {'name': name, 'calls': calls, 'total_ms': round(seconds * 1000, 3)}
+            for name, (calls, seconds) in ordered
+        ]
+
+    def report(self) -> Dict:
+        return {'methods': self._report(self.methods), 'stages': self._report(self.stages)}
+
+
+def record_stage(stage: str, seconds: float):
+    """Ghi thời gian một bước pipeline vào trace của request hiện tại (nếu đang profile)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(trace.stages, stage, seconds)
+
+
+def trace_methods(cls):
+    """
+    Class decorator: đo thời gian (bao gồm cả các method con) của mọi method public khi request đang được profile.
+    Request bình thường chỉ tốn thêm một lần đọc contextvar cho mỗi lần gọi method.
+    """
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith('__') or not callable(attribute) or isinstance(attribute, (staticmethod, classmethod)):
+            continue
+        setattr(cls, name, _traced(attribute, f'{cls.__name__}.{name}'))
+    return cls
+
+
+def _traced(fn, qualified_name: str):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            trace.add(trace.methods, qualified_name, time.perf_counter() - started)
+    return wrapper
+
+
+_traced_code = _traced(lambda: None, '').__code__
+
+
+class StackSampler:
+    """Sampling profiler đơn giản: lấy stack của một thread theo chu kỳ, xuất dạng collapsed stacks (flame graph)"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # Bỏ các frame wrapper của trace_methods
+                if code is not _traced_code:
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+def profile_allowed(token: Optional[str]) -> bool:
+    """Profiling được bật trong cấu hình và token khớp (nếu có cấu hình token)"""
+    if not config.PROFILE_ENABLED:
+        return False
+    return not config.PROFILE_TOKEN or token == config.PROFILE_TOKEN
+
+
+def parse_profile_mode(value) -> Optional[str]:
+    """Đọc trường profile của request: true = chỉ đo thời gian, hoặc tên chế độ; raise ValueError nếu không hợp lệ"""
+    if value is None or value is False:
+        return None
+    if value is True:
+        return 'timing'
+    if value not in PROFILE_MODES:
+        raise ValueError(f'profile phải là true hoặc một trong: {", ".join(PROFILE_MODES)}')
+    return value
+
+
+def _dump_path(extension: str) -> str:
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.{extension}"
+    return os.path.join(config.PROFILE_DIR, name)
+
+
+@contextmanager
+def profiled(mode: str):
+    """
+    Profile khối lệnh trên thread hiện tại, trả về dict báo cáo (được điền sau khi khối lệnh kết thúc):
+    thời gian tổng, theo method và theo bước, kèm đường dẫn file dump với chế độ cprofile/sample
+    """
+    report: Dict = {'mode': mode}
+    trace = Trace()
+    token = _current_trace.set(trace)
+    profiler = sampler = None
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif mode == 'sample':
+        sampler = StackSampler(threading.get_ident(), config.PROFILE_SAMPLE_INTERVAL)
+        sampler.start()
+    started = time.perf_counter()
+    try:
+        yield report
+    finally:
+        report['total_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if profiler is not None:
+            profiler.disable()
+            report['dump'] = _dump_path('prof')
+            profiler.dump_stats(report['dump'])
+        if sampler is not None:
+            sampler.stop()
+            report['dump'] = _dump_path('folded')
+            report['samples'] = sampler.samples
+            sampler.dump(report['dump'])
+        _current_trace.reset(token)
+        report.update(trace.report())
+
+
+def profile_analysis(analyzer, text: str, mode: str, use_nltk: Optional[bool] = None, deadline=None,
+                     layers=None) -> Optional[Dict]:
+    """Phân tích văn bản (bỏ qua cache để đo đúng các bước) và gắn báo cáo profiling vào kết quả"""
+    with profiled(mode) as report:
+        result = analyzer.analyze_text(text, use_nltk, deadline, use_cache=False, layers=layers)
+    if result is None:
+        return None
+    return dict(result, profile=report)
@@ -0,0 +1,110 @@
+"""
+ETag theo nội dung và nén response (dùng chung cho app.py và asgi.py).
+ETag của kết quả phân tích được suy ra từ khóa cache (văn bản được phân tích + version model/rules),
+nên request có điều kiện được trả lời 304 mà không cần phân tích hay tra cache
+"""
+
+import gzip
+import re
+from typing import Optional, Tuple
+
+import config
+from layers import LAYERS
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, chỉ dùng gzip
+    brotli = None
+
+# Khóa cache/nội dung: SHA-256 dạng hex
+CONTENT_KEY = re.compile(r'^[0-9a-f]{64}$')
+
+
+def result_etag(text_hash: str, layers=None, schema: str = 'v1') -> str:
+    """
+    ETag (weak: cùng nội dung có thể được gửi ở dạng nén khác nhau) cho kết quả của một khóa nội dung,
+    phân biệt theo layers và schema của response
+    """
+    variant = [schema] if schema != 'v1' else []
+    if layers is not None:
+        variant.append('+'.join(layer for layer in LAYERS if layer in layers))
+    suffix = ''.join(f'-{part}' for part in variant)
+    return f'W/"{text_hash}{suffix}"'
+
+
+def lookup_available(shared_cache: bool, processes: int) -> bool:
+    """
+    GET /analyze/<khóa> có tra được kết quả vừa trả về không: cache dùng chung giữa các process
+    (tầng trên đĩa) hoặc chỉ có một process. Nếu không, request có thể đến process khác và nhận 404
+    """
+    return shared_cache or processes <= 1
+
+
+def result_location(text_hash: str, layers=None, schema: str = 'v1') -> str:
+    """Địa chỉ GET của kết quả theo khóa nội dung (kèm layers/schema nếu khác mặc định)"""
+    params = []
+    if layers is not None:
+        params.append('layers=' + ','.join(layer for layer in LAYERS if layer in layers))
+    if schema != 'v1':
+        params.append(f'schema={schema}')
+    return f'/analyze/{text_hash}' + (f"?{'&'.join(params)}" if params else '')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str, exists: bool = False) -> bool:
+    """
+    If-None-Match có chứa ETag (so sánh weak). '*' chỉ khớp khi kết quả hiện có (exists=True, RFC 9110),
+    nên phải tra cache trước khi trả lời 304 cho '*'
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return exists
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Chọn 'br' hoặc 'gzip' theo Accept-Encoding (có q-value), None nếu không nén"""
+    if not config.COMPRESSION or not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    def weight(encoding):
+        return weights.get(encoding, weights.get('*', 0.0))
+
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best = max(candidates, key=weight)
+    return best if weight(best) > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=config.BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=config.GZIP_LEVEL)
+
+
+def negotiate_body(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Nén body theo Accept-Encoding nếu đủ lớn, trả về (body, Content-Encoding hoặc None)"""
+    if len(body) < config.COMPRESS_MIN_BYTES:
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return body, None
+    return compress(body, encoding), encoding
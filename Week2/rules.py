@@ -0,0 +1,320 @@
+"""
+Rule engine cho việc sửa nhãn NER, POS và bổ sung entities theo gazetteer
+Rules được khai báo trong rules.json và được biên dịch khi nạp thành bảng tra cứu chính xác (hash)
+và một bộ so khớp chuỗi con Aho–Corasick, có thể nạp lại khi file thay đổi mà không cần khởi động lại
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """Bộ so khớp nhiều chuỗi con trong một lần duyệt văn bản (thuật toán Aho–Corasick)"""
+
+    def __init__(self, patterns):
+        # goto[state] = {ký tự: state tiếp theo}; outputs[state] = các pattern kết thúc tại state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build_failure_links()
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        if pattern not in self._outputs[state]:
+            self._outputs[state].append(pattern)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                # Kế thừa output của trạng thái fail để không bỏ sót pattern lồng nhau
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Trả về mọi lần xuất hiện (start, end, pattern), kể cả chồng lấn"""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in outputs[state]:
+                yield index + 1 - len(pattern), index + 1, pattern
+
+    def find_patterns(self, text: str) -> Set[str]:
+        """Tập các pattern xuất hiện trong văn bản"""
+        return {pattern for _, _, pattern in self.iter_matches(text)}
+
+
+def _is_year(text: str) -> bool:
+    """Văn bản là năm 4 chữ số (có thể có tiền tố 'năm ')"""
+    value = text.replace('năm ', '')
+    return value.isdigit() and len(value) == 4
+
+
+# Các điều kiện bổ sung có thể tham chiếu từ rules.json qua khóa "require"
+REQUIREMENTS: Dict[str, Callable[[str], bool]] = {
+    'year': _is_year
+}
+
+
+class EntityRuleSet:
+    """
+    Một nhóm rules sửa nhãn NER, áp dụng rule đầu tiên khớp (giống chuỗi if/elif).
+    Mỗi rule khớp khi nhãn hiện tại nằm trong "labels" và văn bản (chữ thường) bằng một
+    giá trị trong "exact", chứa một giá trị trong "contains", hoặc chỉ gồm chữ số ("digits").
+    """
+
+    def __init__(self, rules: List[Dict]):
+        self.rules = rules
+        self._exact: Dict[str, List[int]] = {}
+        self._contains: Dict[str, List[int]] = {}
+        self._digit_rules: List[int] = []
+
+        for index, rule in enumerate(rules):
+            if 'set_label' not in rule or not rule.get('labels'):
+                raise ValueError(f"Rule #{index} thiếu 'labels' hoặc 'set_label'")
+            if rule.get('require') and rule['require'] not in REQUIREMENTS:
+                raise ValueError(f"Rule #{index} có điều kiện không hợp lệ: {rule['require']}")
+            rule['labels'] = set(rule['labels'])
+            for term in rule.get('exact', []):
+                self._exact.setdefault(term.lower(), []).append(index)
+            for term in rule.get('contains', []):
+                self._contains.setdefault(term.lower(), []).append(index)
+            if rule.get('digits'):
+                self._digit_rules.append(index)
+
+        self._matcher = AhoCorasick(self._contains)
+
+    def match(self, text: str, label: str) -> Optional[Dict]:
+        """Tìm rule đầu tiên khớp với văn bản (chữ thường) và nhãn hiện tại"""
+        candidates = list(self._exact.get(text, ()))
+        if self._matcher:
+            for pattern in self._matcher.find_patterns(text):
+                candidates.extend(self._contains[pattern])
+        if self._digit_rules and text.isdigit():
+            candidates.extend(self._digit_rules)
+
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            if label in rule['labels']:
+                return rule
+        return None
+
+    def apply(self, entity: Dict, describe: Optional[Callable[[str], str]] = None) -> Dict:
+        """Sửa nhãn của entity theo rule khớp đầu tiên"""
+        rule = self.match(entity['text'].lower(), entity['label'])
+        if rule is None:
+            return entity
+
+        require = rule.get('require')
+        if require and not REQUIREMENTS[require](entity['text'].lower()):
+            return entity
+
+        entity['label'] = rule['set_label']
+        if 'description' in rule:
+            entity['description'] = rule['description']
+        elif describe is not None:
+            entity['description'] = describe(rule['set_label'])
+        return entity
+
+
+class PosRuleSet:
+    """Rules sửa POS tag theo token (chữ thường) và tag hiện tại, có thể kiểm tra ngữ cảnh xung quanh"""
+
+    def __init__(self, rules: List[Dict]):
+        self._rules: Dict[Tuple[str, str], Dict] = {}
+        for index, rule in enumerate(rules):
+            if 'set_pos' not in rule or 'pos' not in rule:
+                raise ValueError(f"POS rule #{index} thiếu 'pos' hoặc 'set_pos'")
+            for token in rule.get('tokens', []):
+                # Rule khai báo trước được ưu tiên
+                self._rules.setdefault((token.lower(), rule['pos']), rule)
+
+    def apply(self, pos_tags: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Sửa danh sách (token, pos)"""
+        corrected_tags = []
+        for i, (token, pos) in enumerate(pos_tags):
+            rule = self._rules.get((token.lower(), pos))
+            if rule is None:
+                corrected_tags.append((token, pos))
+                continue
+
+            context_words = rule.get('context_contains')
+            if context_words:
+                # Kiểm tra ngữ cảnh xung quanh
+                window = rule.get('context_window', 2)
+                context_text = ' '.join(
+                    pos_tags[j][0].lower()
+                    for j in range(max(0, i - window), min(len(pos_tags), i + window + 1))
+                    if j != i
+                )
+                if not any(word in context_text for word in context_words):
+                    corrected_tags.append((token, pos))
+                    continue
+
+            corrected_tags.append((token, rule['set_pos']))
+        return corrected_tags
+
+
+TERM_CASES: Dict[str, Callable[[str], str]] = {
+    'title': str.title,
+    'upper': str.upper,
+    'lower': str.lower,
+    'capitalize': str.capitalize
+}
+
+
+class GazetteerScanner:
+    """
+    Quét mọi từ khóa của gazetteer trong một lần duyệt văn bản (Aho–Corasick).
+    Mỗi nhóm ("name") có nhãn, mô tả và cách viết hoa ("case") cho entity được thêm vào.
+    """
+
+    def __init__(self, categories: List[Dict]):
+        self.categories = categories
+        # term -> [(chỉ số nhóm, chỉ số term trong nhóm)]
+        self._terms: Dict[str, List[Tuple[int, int]]] = {}
+        for category_index, category in enumerate(categories):
+            if not category.get('label') or 'terms' not in category:
+                raise ValueError(f"Gazetteer #{category_index} thiếu 'label' hoặc 'terms'")
+            if category.get('case', 'title') not in TERM_CASES:
+                raise ValueError(f"Gazetteer #{category_index} có 'case' không hợp lệ: {category['case']}")
+            for term_index, term in enumerate(category['terms']):
+                self._terms.setdefault(term.lower(), []).append((category_index, term_index))
+        self._matcher = AhoCorasick(self._terms)
+
+    def find_terms(self, text_lower: str) -> Set[str]:
+        """Tập các từ khóa xuất hiện trong văn bản (chữ thường)"""
+        return self._matcher.find_patterns(text_lower) if self._matcher else set()
+
+    def scan(self, text_lower: str) -> List[Tuple[int, int, str, Dict]]:
+        """
+        Trả về (start, end, term, nhóm) cho lần xuất hiện đầu tiên của mỗi từ khóa dưới dạng từ trọn vẹn
+        (không nằm giữa một từ khác, ví dụ "nam" trong "vinamilk")
+        """
+        if not self._matcher:
+            return []
+        first_seen: Dict[str, Tuple[int, int]] = {}
+        for start, end, term in self._matcher.iter_matches(text_lower):
+            if not self.at_word_boundary(text_lower, start, end):
+                continue
+            # iter_matches trả về theo vị trí kết thúc; giữ lần xuất hiện bắt đầu sớm nhất
+            if term not in first_seen or start < first_seen[term][0]:
+                first_seen[term] = (start, end)
+
+        hits = []
+        for term, (start, end) in first_seen.items():
+            for category_index, _ in self._terms[term]:
+                hits.append((start, end, term, self.categories[category_index]))
+        return hits
+
+    @staticmethod
+    def at_word_boundary(text: str, start: int, end: int) -> bool:
+        """Ký tự ngay trước start và tại end (nếu có) không phải chữ/số"""
+        return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+    @staticmethod
+    def format_term(term: str, category: Dict) -> str:
+        """Viết hoa từ khóa theo cấu hình của nhóm"""
+        return TERM_CASES[category.get('case', 'title')](term)
+
+
+class RuleBook:
+    """Tập hợp các rule sets đã biên dịch từ một file rules, tự nạp lại khi file thay đổi"""
+
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._mtime = None
+        self.version = ''
+        self.sets: Dict[str, object] = {}
+        self.reload(force=True)
+
+    def _compile(self, data: Dict) -> Dict[str, object]:
+        return {
+            'vietnamese_ner': EntityRuleSet(data.get('vietnamese_ner', [])),
+            'english_ner': EntityRuleSet(data.get('english_ner', [])),
+            'mixed_ner': EntityRuleSet(data.get('mixed_ner', [])),
+            'vietnamese_pos': PosRuleSet(data.get('vietnamese_pos', [])),
+            'vietnamese_gazetteer': GazetteerScanner(data.get('vietnamese_gazetteer', []))
+        }
+
+    def reload(self, force: bool = False) -> bool:
+        """Nạp lại rules nếu file đã thay đổi, trả về True nếu có nạp lại"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            mtime = os.path.getmtime(self.path)
+            if not force and mtime == self._mtime:
+                return False
+
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8'))
+            # Biên dịch xong mới thay thế, request đang chạy vẫn dùng bản cũ nhất quán
+            sets = self._compile(data)
+            digest = hashlib.sha256(raw).hexdigest()[:12]
+
+            self.sets = sets
+            self.version = f"{data.get('version', 0)}-{digest}"
+            self._mtime = mtime
+            logger.info(f"Loaded rules {self.path} (version {self.version})")
+            return True
+
+    def maybe_reload(self) -> bool:
+        """Kiểm tra file rules định kỳ (tối đa mỗi reload_interval giây), lỗi khi nạp giữ nguyên bản cũ"""
+        if self.reload_interval <= 0 or time.monotonic() - self._last_check < self.reload_interval:
+            return False
+        try:
+            return self.reload()
+        except Exception as e:
+            logger.error(f"Không thể nạp lại rules {self.path}: {e}")
+            return False
+
+    def correct_entity(self, set_name: str, entity: Dict, describe: Optional[Callable[[str], str]] = None) -> Dict:
+        """Sửa nhãn entity theo rule set tương ứng"""
+        return self.sets[set_name].apply(entity, describe)
+
+    def scanner(self, set_name: str) -> GazetteerScanner:
+        """Gazetteer scanner đã biên dịch"""
+        return self.sets[set_name]
+
+    def correct_pos_tags(self, set_name: str, pos_tags: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Sửa POS tags theo rule set tương ứng"""
+        return self.sets[set_name].apply(pos_tags)
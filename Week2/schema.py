@@ -0,0 +1,143 @@
+"""
+Định dạng response v2 (gọn, dạng cột) cho kết quả phân tích. Mỗi layer chỉ được lưu một lần,
+tokens/entities là các mảng song song, còn nhãn POS/tag/entity/description được intern vào bảng labels
+(các cột chỉ chứa chỉ số). Định dạng v1 (mặc định) giữ nguyên cho client cũ.
+
+Quy ước của v2:
+- tokens.lemma không có: lemma trùng với text; tokens.tag không có: tag trùng với pos
+- nltk_analysis của v1 = các token không phải khoảng trắng kèm tag; trường nltk chỉ có khi khác với quy ước này
+  (ví dụ khi chạy NLTK riêng)
+"""
+
+from typing import Dict, List, Optional
+
+SCHEMAS = ('v1', 'v2')
+# Các trường được giữ nguyên từ kết quả v1
+PASSTHROUGH_FIELDS = ('confidence_score', 'layers', 'partial', 'skipped_stages', 'profile')
+
+
+def parse_schema(value) -> str:
+    """Đọc trường schema của request (v1/v2, 1/2), mặc định v1; raise ValueError nếu không hợp lệ"""
+    if value is None:
+        return 'v1'
+    if isinstance(value, bool):
+        raise ValueError('schema phải là v1 hoặc v2')
+    value = str(value).lower()
+    if not value.startswith('v'):
+        value = f'v{value}'
+    if value not in SCHEMAS:
+        raise ValueError('schema phải là v1 hoặc v2')
+    return value
+
+
+class LabelTable:
+    """Bảng intern nhãn: mỗi nhãn xuất hiện một lần, các cột lưu chỉ số trong bảng"""
+
+    def __init__(self):
+        self.labels: List = []
+        self._index: Dict = {}
+
+    def __call__(self, label) -> int:
+        index = self._index.get(label)
+        if index is None:
+            index = self._index[label] = len(self.labels)
+            self.labels.append(label)
+        return index
+
+
+def _token_table(analysis: Dict, nltk: Dict, labels: Dict[str, LabelTable]) -> Optional[Dict]:
+    tokens_with_pos = analysis.get('tokens_with_pos') or []
+    if tokens_with_pos:
+        texts = [token['token'] for token in tokens_with_pos]
+        table = {'text': texts, 'pos': [labels['pos'](token['pos']) for token in tokens_with_pos]}
+        if any(token['tag'] != token['pos'] for token in tokens_with_pos):
+            table['tag'] = [labels['tag'](token['tag']) for token in tokens_with_pos]
+        if any(token['lemma'] != text for token, text in zip(tokens_with_pos, texts)):
+            table['lemma'] = [token['lemma'] for token in tokens_with_pos]
+        return table
+
+    # Không có thông tin token chi tiết (ví dụ chỉ chọn layer tokens): dùng tokens của nltk_analysis
+    if 'tokens' not in nltk:
+        return None
+    table = {'text': list(nltk['tokens'])}
+    pos_tags = nltk.get('pos_tags') or []
+    if pos_tags and [token for token, _ in pos_tags] == table['text']:
+        table['tag'] = [labels['tag'](tag) for _, tag in pos_tags]
+    return table
+
+
+def _derived_nltk(table: Optional[Dict], labels: Dict[str, LabelTable]) -> Dict:
+    """nltk_analysis suy ra từ bảng tokens theo quy ước của v2"""
+    if table is None:
+        return {'tokens': [], 'pos_tags': []}
+    if 'tag' in table:
+        tags = [labels['tag'].labels[index] for index in table['tag']]
+    elif 'pos' in table:
+        tags = [labels['pos'].labels[index] for index in table['pos']]
+    else:
+        tags = None
+    kept = [index for index, text in enumerate(table['text']) if not text.isspace()]
+    tokens = [table['text'][index] for index in kept]
+    pos_tags = [(tokens[position], tags[index]) for position, index in enumerate(kept)] if tags is not None else []
+    return {'tokens': tokens, 'pos_tags': pos_tags}
+
+
+def _nltk_matches(nltk: Dict, derived: Dict) -> bool:
+    if 'tokens' in nltk and list(nltk['tokens']) != derived['tokens']:
+        return False
+    if 'pos_tags' in nltk and [tuple(pair) for pair in nltk['pos_tags']] != derived['pos_tags']:
+        return False
+    return True
+
+
+def _entity_table(entities: List[Dict], labels: Dict[str, LabelTable]) -> Dict:
+    return {
+        'text': [entity['text'] for entity in entities],
+        'label': [labels['entity'](entity['label']) for entity in entities],
+        'start': [entity.get('start') for entity in entities],
+        'end': [entity.get('end') for entity in entities],
+        'description': [labels['description'](entity.get('description')) for entity in entities]
+    }
+
+
+def compact_result(result: Dict) -> Dict:
+    """Chuyển kết quả phân tích (v1) sang định dạng v2"""
+    labels = {name: LabelTable() for name in ('pos', 'tag', 'entity', 'description')}
+    analysis = result.get('spacy_analysis') or {}
+    nltk = result.get('nltk_analysis') or {}
+
+    compact = {
+        'schema': 'v2',
+        'language': result.get('language'),
+        'detected_language': result.get('detected_language')
+    }
+    table = _token_table(analysis, nltk, labels)
+    if table is not None:
+        compact['tokens'] = table
+    if nltk and not _nltk_matches(nltk, _derived_nltk(table, labels)):
+        # NLTK gán tag cho đúng danh sách tokens của nó: tag (nếu có) song song với text
+        compact['nltk'] = {
+            'text': list(nltk.get('tokens', [])),
+            'tag': [labels['tag'](tag) for _, tag in nltk.get('pos_tags') or []]
+        }
+    if 'entities' in analysis:
+        compact['entities'] = _entity_table(analysis['entities'], labels)
+    if 'segments' in result:
+        segments = result['segments']
+        compact['segments'] = {
+            'start': [segment['start'] for segment in segments],
+            'end': [segment['end'] for segment in segments],
+            'language': [segment['language'] for segment in segments]
+        }
+    for field in PASSTHROUGH_FIELDS:
+        if field in result:
+            compact[field] = result[field]
+    compact['labels'] = {name: label_table.labels for name, label_table in labels.items() if label_table.labels}
+    return compact
+
+
+def render_result(result: Optional[Dict], schema: str) -> Optional[Dict]:
+    """Kết quả theo schema được yêu cầu (v1 trả về nguyên kết quả)"""
+    if result is None or schema == 'v1':
+        return result
+    return compact_result(result)
@@ -0,0 +1,97 @@
+"""
+Căn chỉnh token về vị trí ký tự trong văn bản gốc và chỉ mục khoảng (span)
+để gộp entities, loại bỏ entities chồng lấn theo vị trí thay vì so sánh chuỗi
+"""
+
+import bisect
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Span = Tuple[int, int]
+
+
+def _skipped_only_separators(text: str) -> bool:
+    """Đoạn bị bỏ qua giữa hai token chỉ gồm khoảng trắng/dấu câu"""
+    return not any(char.isalnum() for char in text)
+
+
+def find_token(text: str, token: str, position: int) -> Optional[Span]:
+    """Tìm token trong văn bản từ vị trí position, cho phép '_' hoặc nhiều khoảng trắng giữa các âm tiết"""
+    if not token:
+        return None
+
+    index = text.find(token, position)
+    if index != -1 and _skipped_only_separators(text[position:index]):
+        return index, index + len(token)
+
+    # pyvi nối âm tiết bằng '_', underthesea bằng ' ': so khớp linh hoạt với văn bản gốc
+    parts = [part for part in re.split(r'[\s_]+', token) if part]
+    if not parts:
+        return None
+    pattern = re.compile(r'[\s_]+'.join(re.escape(part) for part in parts))
+    match = pattern.search(text, position)
+    if match and _skipped_only_separators(text[position:match.start()]):
+        return match.span()
+    return None
+
+
+def align_tokens(text: str, tokens: Sequence[str]) -> List[Optional[Span]]:
+    """Ánh xạ từng token đã tách về (start, end) trong văn bản gốc, None nếu không tìm thấy"""
+    spans: List[Optional[Span]] = []
+    position = 0
+    for token in tokens:
+        span = find_token(text, token, position)
+        spans.append(span)
+        if span is not None:
+            position = span[1]
+    return spans
+
+
+def has_span(entity: Dict) -> bool:
+    """Entity có offset hợp lệ"""
+    return entity.get('end', 0) > entity.get('start', 0)
+
+
+class SpanIndex:
+    """Chỉ mục các khoảng đã sắp xếp, kiểm tra chồng lấn trong O(log n)"""
+
+    def __init__(self, spans: Sequence[Span]):
+        ordered = sorted(spans)
+        self._starts = [start for start, _ in ordered]
+        # _max_ends[i] = end lớn nhất trong các khoảng 0..i
+        self._max_ends = []
+        max_end = -1
+        for _, end in ordered:
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Khoảng [start, end) có chồng lấn khoảng nào trong chỉ mục không"""
+        # Chỉ các khoảng bắt đầu trước end mới có thể chồng lấn
+        count = bisect.bisect_left(self._starts, end)
+        return count > 0 and self._max_ends[count - 1] > start
+
+
+def merge_entities(existing: List[Dict], candidates: List[Dict]) -> List[Dict]:
+    """
+    Gộp entities bổ sung vào entities đã có: bỏ candidates chồng lấn entities đã có (được ưu tiên)
+    hoặc chồng lấn candidate đã chọn trước đó (ưu tiên bắt đầu sớm hơn, rồi dài hơn).
+    Entities đã có nhưng không có offset được so sánh theo chuỗi như trước.
+    """
+    index = SpanIndex([(entity['start'], entity['end']) for entity in existing if has_span(entity)])
+    unaligned_text = '\n'.join(entity['text'] for entity in existing if not has_span(entity)).lower()
+
+    accepted = []
+    accepted_end = -1
+    for candidate in sorted(candidates, key=lambda entity: (entity['start'], entity['start'] - entity['end'])):
+        start, end = candidate['start'], candidate['end']
+        if index.overlaps(start, end) or start < accepted_end:
+            continue
+        if unaligned_text and candidate['text'].lower() in unaligned_text:
+            continue
+        accepted.append(candidate)
+        accepted_end = end
+    return accepted
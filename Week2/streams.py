@@ -0,0 +1,67 @@
+"""
+Đọc corpus theo từng dòng (NDJSON hoặc text thuần) mà không nạp toàn bộ vào bộ nhớ
+"""
+
+import json
+
+
+def read_stream_items(stream, is_ndjson: bool, max_line_bytes: int):
+    """
+    Đọc từng dòng từ stream nhị phân (request body hoặc file), trả về (số dòng, id, văn bản, lỗi).
+    Không đọc toàn bộ body vào bộ nhớ; dòng dài hơn max_line_bytes bị bỏ qua.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Bỏ phần còn lại của dòng quá dài
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            yield line_number, None, None, f'Dòng quá dài (tối đa {max_line_bytes} bytes)'
+            continue
+        
+        try:
+            content = line.decode('utf-8').strip()
+        except UnicodeDecodeError:
+            yield line_number, None, None, 'Dòng không phải UTF-8'
+            continue
+        if not content:
+            continue
+        
+        if not is_ndjson:
+            yield line_number, None, content, None
+            continue
+        
+        try:
+            data = json.loads(content)
+        except ValueError:
+            yield line_number, None, None, 'Dòng JSON không hợp lệ'
+            continue
+        if isinstance(data, str):
+            yield line_number, None, data, None
+        elif isinstance(data, dict):
+            yield line_number, data.get('id'), data.get('text'), None
+        else:
+            yield line_number, None, None, 'Mỗi dòng phải là object {"text": ...} hoặc chuỗi'
+
+
+def analyze_chunk(analyzer, chunk, use_nltk=None) -> list:
+    """
+    Phân tích một nhóm dòng đọc từ read_stream_items bằng analyze_batch,
+    trả về một kết quả cho mỗi dòng (kèm số dòng và id nếu có)
+    """
+    texts = [text for _, _, text, error in chunk if error is None]
+    results = iter(analyzer.analyze_batch(texts, use_nltk=use_nltk)) if texts else iter(())
+    
+    rows = []
+    for line_number, item_id, _, error in chunk:
+        item = {'success': False, 'error': error} if error is not None else next(results)
+        item = dict(item, line=line_number)
+        if item_id is not None:
+            item['id'] = item_id
+        rows.append(item)
+    return rows